@@ -1,8 +1,6 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
-from openai import OpenAI
 import openai
-import PyPDF2
 import io
 import traceback
 import os
@@ -20,29 +18,74 @@ import wave
 import cv2
 from hume import HumeStreamClient
 from hume.models.config import ProsodyConfig, FaceConfig
-import numpy as np
 import requests
-from functools import wraps
 import traceback
-from huggingface_hub import InferenceClient
+import huggingface_hub
 import tempfile
 from werkzeug.utils import secure_filename
 import logging
 import time
-from functools import wraps
+import hashlib
+import hmac
+import urllib.parse
+import cache
+import event_loop
+import llm_clients
+from singleflight import SingleFlight
+import retry
+from retry import with_retries
+from hedging import Hedger
+from evi_pool import EviPool
+import pdf_text
+import prompt_compaction
+import relevance
+from audio_chunks import split_audio_bytes, concat_wav_chunks
+from collections import deque
+from emotions import aggregate_predictions, emotion_timeline
+from uploads import SpooledUploadRequest, read_upload, read_upload_base64
+from pitch_stream import PitchStreamParser, sse_event
 
 app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": ["https://career-buddy.netlify.app/", "http://localhost:3000"]}})
+app.request_class = SpooledUploadRequest
+CORS_ORIGINS = ["https://career-buddy.netlify.app/", "http://localhost:3000"]
+# Audio responses carry their transcript and cache validators in headers the browser
+# must be allowed to read
+AUDIO_TEXT_HEADER = 'X-Text-Response'
+AUDIO_ID_HEADER = 'X-Audio-Id'
+AUDIO_EXPOSED_HEADERS = [AUDIO_TEXT_HEADER, AUDIO_ID_HEADER, 'ETag']
+CORS(app, resources={r"/*": {"origins": CORS_ORIGINS}}, expose_headers=AUDIO_EXPOSED_HEADERS)
 
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+# Server-side Hugging Face token, only used when hedging pitch requests to an HF model
+HF_API_TOKEN = os.getenv('HF_API_TOKEN')
 HUME_AI_API_KEY = os.getenv('HUME_AI_API_KEY')
 HUME_AI_API_URL = "wss://api.hume.ai/v0/stream/evi"
 
 API_KEY = os.getenv("HUME_AI_API_KEY")
 API_URL = "wss://api.hume.ai/v0/evi/chat"
+# Optional EVI configuration (voice etc.); part of the audio cache key
+HUME_EVI_CONFIG_ID = os.getenv('HUME_EVI_CONFIG_ID', '')
+# Warm EVI sessions kept open per worker (0 disables the pool); see evi_pool.py
+EVI_POOL_SIZE = int(os.getenv('EVI_POOL_SIZE', 2)) if API_KEY else 0
+EVI_POOL_MAX_IDLE = float(os.getenv('EVI_POOL_MAX_IDLE', 240))
+EVI_POOL_MAX_AGE = float(os.getenv('EVI_POOL_MAX_AGE', 1500))
+EVI_POOL_PING_INTERVAL = float(os.getenv('EVI_POOL_PING_INTERVAL', 20))
+# A warm session that hasn't answered within this many seconds is replaced by a fresh one
+EVI_POOL_FIRST_REPLY_TIMEOUT = float(os.getenv('EVI_POOL_FIRST_REPLY_TIMEOUT', 10))
 
 API_TYPE = ""
 
+# Per-branch timeout (seconds) for the Hume audio and video analyses in /analyze-practice
+HUME_ANALYSIS_TIMEOUT = float(os.getenv('HUME_ANALYSIS_TIMEOUT', 60))
+
+# Practice audio is sent to Hume in short chunks (the stream API caps payload length)
+HUME_AUDIO_CHUNK_SECONDS = float(os.getenv('HUME_AUDIO_CHUNK_SECONDS', 5))
+HUME_AUDIO_CHUNK_CONCURRENCY = int(os.getenv('HUME_AUDIO_CHUNK_CONCURRENCY', 4))
+
+# Default and maximum number of windows in the optional practice analysis timeline
+TIMELINE_WINDOWS = int(os.getenv('TIMELINE_WINDOWS', 60))
+TIMELINE_MAX_WINDOWS = 600
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -78,42 +121,171 @@ Must format your response exactly as follows:
 
 """
 
-def retry_with_backoff(retries=3, backoff_in_seconds=1):
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            x = 0
-            while True:
-                try:
-                    return func(*args, **kwargs)
-                except Exception as e:
-                    if x == retries:
-                        logger.exception(f"All retry attempts failed for {func.__name__}")
-                        raise
-                    else:
-                        wait = backoff_in_seconds * 2 ** x
-                        logger.warning(f"Attempt {x + 1} failed for {func.__name__}: {str(e)}. Retrying in {wait} seconds...")
-                        time.sleep(wait)
-                        x += 1
-        return wrapper
-    return decorator
-
-def validate_api_key(api_key):
-    client = OpenAI(api_key=api_key)
+OPENAI_MODEL = "gpt-3.5-turbo-0125"
+
+# Resume and job description are compacted to these token budgets before prompting
+PROMPT_COMPACTION_ENABLED = os.getenv('PROMPT_COMPACTION_ENABLED', 'true').lower() == 'true'
+RESUME_TOKEN_BUDGET = int(os.getenv('RESUME_TOKEN_BUDGET', 1500))
+JOB_DESCRIPTION_TOKEN_BUDGET = int(os.getenv('JOB_DESCRIPTION_TOKEN_BUDGET', 1000))
+
+# Long resumes are cut to the RESUME_RELEVANCE_TOP_K passages most relevant to the
+# job description (TF-IDF, in-process) before compaction; 0 disables the selection
+RESUME_RELEVANCE_TOP_K = int(os.getenv('RESUME_RELEVANCE_TOP_K', 6))
+RESUME_RELEVANCE_MIN_TOKENS = int(os.getenv('RESUME_RELEVANCE_MIN_TOKENS', 1000))
+
+# Overall time budget (seconds) for one request's LLM calls, retries included
+LLM_REQUEST_DEADLINE = float(os.getenv('LLM_REQUEST_DEADLINE', 30))
+
+# Bumps automatically whenever the prompt text changes, so stale cached pitches are never served
+SYSTEM_PROMPT_VERSION = hashlib.sha256(SYSTEM_PROMPT.encode('utf-8')).hexdigest()[:12]
+
+# Pitch result cache. Use PITCH_CACHE_BACKEND=disk so every gunicorn worker shares hits.
+PITCH_CACHE_BACKEND = os.getenv('PITCH_CACHE_BACKEND', 'memory')
+PITCH_CACHE_DIR = os.getenv('PITCH_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'careerbuddy-cache'))
+PITCH_CACHE_TTL = int(os.getenv('PITCH_CACHE_TTL', 24 * 3600))
+PITCH_CACHE_MAX_ENTRIES = int(os.getenv('PITCH_CACHE_MAX_ENTRIES', 1024))
+
+# Extracted resume / job description text, keyed by the SHA-256 of the uploaded PDF.
+# The disk backend lets every gunicorn worker reuse a parse; the hash is returned to
+# the client as a handle it can send back instead of re-uploading the file.
+DOCUMENT_CACHE_BACKEND = os.getenv('DOCUMENT_CACHE_BACKEND', 'disk')
+DOCUMENT_CACHE_DIR = os.getenv('DOCUMENT_CACHE_DIR', PITCH_CACHE_DIR)
+DOCUMENT_CACHE_TTL = int(os.getenv('DOCUMENT_CACHE_TTL', 7 * 24 * 3600))
+DOCUMENT_CACHE_MAX_ENTRIES = int(os.getenv('DOCUMENT_CACHE_MAX_ENTRIES', 4096))
+DOCUMENT_CACHE_MAX_BYTES = int(os.getenv('DOCUMENT_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
+document_cache = cache.register(cache.make_cache(
+    'documents',
+    backend=DOCUMENT_CACHE_BACKEND,
+    directory=DOCUMENT_CACHE_DIR,
+    max_entries=DOCUMENT_CACHE_MAX_ENTRIES,
+    ttl=DOCUMENT_CACHE_TTL,
+    max_bytes=DOCUMENT_CACHE_MAX_BYTES,
+))
+
+# Client reuse metrics are reported next to the caches at /cache-stats
+cache.register(llm_clients.registry)
+
+# API key validation cache. Keys are only ever stored as a salted HMAC; set
+# API_KEY_HASH_SALT to keep hashes stable across restarts.
+API_KEY_HASH_SALT = os.getenv('API_KEY_HASH_SALT', '').encode('utf-8') or os.urandom(32)
+API_KEY_VALID_TTL = int(os.getenv('API_KEY_VALID_TTL', 3600))
+API_KEY_INVALID_TTL = int(os.getenv('API_KEY_INVALID_TTL', 60))
+
+api_key_validation_cache = cache.register(cache.MemoryCache('apiKeyValidation', max_entries=4096, ttl=API_KEY_VALID_TTL))
+api_key_validation_flight = cache.register(SingleFlight('apiKeyValidationFlight'))
+
+# Batch pitch generation: one resume, up to BATCH_MAX_JOB_DESCRIPTIONS job descriptions,
+# at most BATCH_CONCURRENCY generations in flight per batch
+BATCH_MAX_JOB_DESCRIPTIONS = int(os.getenv('BATCH_MAX_JOB_DESCRIPTIONS', 20))
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', 4))
+
+# Synthesized pitch audio, keyed by normalized pitch text and EVI config. The disk
+# backend shares it across workers; /audio/<audioId> serves it with an ETag.
+AUDIO_CACHE_BACKEND = os.getenv('AUDIO_CACHE_BACKEND', 'disk')
+AUDIO_CACHE_DIR = os.getenv('AUDIO_CACHE_DIR', PITCH_CACHE_DIR)
+AUDIO_CACHE_TTL = int(os.getenv('AUDIO_CACHE_TTL', 7 * 24 * 3600))
+AUDIO_CACHE_MAX_ENTRIES = int(os.getenv('AUDIO_CACHE_MAX_ENTRIES', 2048))
+AUDIO_CACHE_MAX_BYTES = int(os.getenv('AUDIO_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+
+audio_cache = cache.register(cache.make_cache(
+    'audio',
+    backend=AUDIO_CACHE_BACKEND,
+    directory=AUDIO_CACHE_DIR,
+    max_entries=AUDIO_CACHE_MAX_ENTRIES,
+    ttl=AUDIO_CACHE_TTL,
+    max_bytes=AUDIO_CACHE_MAX_BYTES,
+))
+audio_flight = cache.register(SingleFlight('audioSynthesisFlight'))
+
+# Identical concurrent pitch generations share one upstream call
+pitch_flight = cache.register(SingleFlight('pitchGenerationFlight'))
+
+# Hedged pitch generation: if the primary provider hasn't answered within its recent
+# p95 latency (or fails with a retryable error, an open circuit or the deadline), the
+# alternate configured for it ("openai" or "hf:<model>") is started too and the first
+# successful answer wins. While the primary's circuit is open the alternate is called
+# directly. Alternates on another provider use a server key, so they are only used in
+# trial mode.
+PITCH_HEDGE_ENABLED = os.getenv('PITCH_HEDGE_ENABLED', 'false').lower() == 'true'
+PITCH_HEDGE_ALTERNATES = {
+    'openai': os.getenv('PITCH_HEDGE_OPENAI_ALTERNATE', ''),
+    'hf': os.getenv('PITCH_HEDGE_HF_ALTERNATE', ''),
+}
+pitch_hedger = cache.register(Hedger(
+    'pitchHedging',
+    percentile=float(os.getenv('PITCH_HEDGE_PERCENTILE', 95)),
+    min_samples=int(os.getenv('PITCH_HEDGE_MIN_SAMPLES', 20)),
+    default_delay=float(os.getenv('PITCH_HEDGE_DEFAULT_DELAY', 8)),
+    min_delay=float(os.getenv('PITCH_HEDGE_MIN_DELAY', 1)),
+    max_delay=float(os.getenv('PITCH_HEDGE_MAX_DELAY', 20)),
+    fallback_on=lambda e: (retry.classify_error(e).retryable
+                           or isinstance(e, (retry.CircuitOpenError, retry.DeadlineExceededError))),
+    unavailable=lambda label: retry.breakers[label.partition(':')[0]].state == 'open',
+))
+
+pitch_cache = cache.register(cache.make_cache(
+    'pitches',
+    backend=PITCH_CACHE_BACKEND,
+    directory=PITCH_CACHE_DIR,
+    max_entries=PITCH_CACHE_MAX_ENTRIES,
+    ttl=PITCH_CACHE_TTL,
+))
+
+def api_key_cache_key(api_type, api_key):
+    return hmac.new(API_KEY_HASH_SALT, f"{api_type}:{api_key}".encode('utf-8'), hashlib.sha256).hexdigest()
+
+async def probe_api_key(api_key, api_type='openai'):
+    # Cheapest authenticated call per provider. Returns (is_valid, cacheable);
+    # transient failures are reported invalid but not cached.
+    if api_type == 'hf':
+        try:
+            await asyncio.to_thread(huggingface_hub.whoami, token=api_key)
+            return True, True
+        except requests.HTTPError as e:
+            print(f"API Key Validation Error: {str(e)}")
+            status = e.response.status_code if e.response is not None else None
+            return False, status in (401, 403)
+        except Exception as e:
+            print(f"API Key Validation Error: {str(e)}")
+            return False, False
+
+    # A single model lookup instead of listing every model
+    client = llm_clients.async_openai_client(api_key).with_options(timeout=10, max_retries=0)
     try:
-        print(client.models.list())
-        return True
+        await client.models.retrieve(OPENAI_MODEL)
+        return True, True
+    except (openai.AuthenticationError, openai.PermissionDeniedError) as e:
+        print(f"API Key Validation Error: {str(e)}")
+        return False, True
+    except (openai.NotFoundError, openai.RateLimitError):
+        # The key authenticated; it just can't use this model right now
+        return True, True
     except Exception as e:
         print(f"API Key Validation Error: {str(e)}")
-        return False
+        return False, False
+
+async def validate_api_key(api_key, api_type='openai'):
+    # Returns (is_valid, cached). Simultaneous checks of the same key share one probe.
+    key = api_key_cache_key(api_type, api_key)
+    is_valid = api_key_validation_cache.get(key)
+    if is_valid is not None:
+        return is_valid, True
+
+    async def check():
+        is_valid, cacheable = await probe_api_key(api_key, api_type)
+        if cacheable:
+            ttl = API_KEY_VALID_TTL if is_valid else API_KEY_INVALID_TTL
+            api_key_validation_cache.set(key, is_valid, ttl=ttl)
+        return is_valid
+
+    is_valid, _ = await api_key_validation_flight.do(key, check)
+    return is_valid, False
 
 def extract_text_from_pdf(pdf_file):
     print("Extracting pdf")
     try:
-        pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_file))
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text()
+        text = pdf_text.extract_text(pdf_file)
         #if debugLevel == 3:
         #print("Extracted text:", text[:100])
         return text
@@ -121,60 +293,210 @@ def extract_text_from_pdf(pdf_file):
         print(f"Error reading PDF: {str(e)}")
         return None
 
-@retry_with_backoff(retries=3)
-def generate_pitches_hf(hf_token, model_name, resume, job_description):
+def document_cache_key(document_hash):
+    # Extraction settings are part of the key so changing them never serves stale text
+    return cache.hash_key(document_hash, pdf_text.resolve_backend(), pdf_text.PDF_MAX_PAGES, pdf_text.PDF_MAX_CHARS,
+                          pdf_text.PAGE_BREAK, pdf_text.TEXT_VERSION)
+
+def is_document_hash(value):
+    return len(value) == 64 and all(c in '0123456789abcdef' for c in value)
+
+def extract_document(pdf_file):
+    # Returns (text, sha256 of the PDF bytes); text is None if the PDF can't be read
+    return extract_documents([pdf_file])[0]
+
+def extract_documents(pdf_files):
+    # Like extract_document for several uploads; the ones not already cached are
+    # parsed concurrently in the PDF process pool
+    results = [None] * len(pdf_files)
+    misses = []
+    for i, pdf_file in enumerate(pdf_files):
+        document_hash = hashlib.sha256(pdf_file).hexdigest()
+        text = document_cache.get(document_cache_key(document_hash))
+        if text is not None:
+            logger.info("Document cache hit")
+            results[i] = (text, document_hash)
+        else:
+            misses.append((i, pdf_file, document_hash))
+
+    if len(misses) > 1 and pdf_text.PDF_WORKERS > 1:
+        pool = pdf_text.get_pool()
+        futures = [pool.submit(pdf_text.extract_text, pdf_file, parallel=False) for _, pdf_file, _ in misses]
+        texts = []
+        for future in futures:
+            try:
+                texts.append(future.result())
+            except Exception as e:
+                print(f"Error reading PDF: {str(e)}")
+                texts.append(None)
+    else:
+        texts = [extract_text_from_pdf(pdf_file) for _, pdf_file, _ in misses]
+
+    for (i, _, document_hash), text in zip(misses, texts):
+        if text is not None:
+            text = pdf_text.normalize(text)
+            document_cache.set(document_cache_key(document_hash), text)
+        results[i] = (text, document_hash)
+    return results
+
+def store_text_document(text):
+    # Pasted text gets a content ID too, so it can be referenced like an uploaded PDF
+    text = pdf_text.normalize(text)
+    document_id = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    document_cache.set(document_cache_key(document_id), text)
+    return text, document_id
+
+def lookup_document(document_hash):
+    return document_cache.get(document_cache_key(document_hash))
+
+def resolve_document(data, files, file_field, id_fields, text_field, label):
+    # Returns (text, hash, error). A document ID from /documents (or the hash returned
+    # by an earlier upload, which is the same value) can replace the upload.
+    if file_field in files:
+        text, document_hash = extract_document(files[file_field].read())
+        if text is None:
+            return None, None, ({"error": f"Failed to read {label} PDF file"}, 400)
+        return text, document_hash, None
+    hash_field = next((field for field in id_fields if data.get(field)), None)
+    if hash_field:
+        document_hash = str(data.get(hash_field)).lower()
+        if not is_document_hash(document_hash):
+            return None, None, ({"error": f"Invalid {hash_field}"}, 400)
+        text = lookup_document(document_hash)
+        if text is None:
+            return None, None, ({"error": f"Unknown {hash_field}, please upload the {label} file again"}, 404)
+        return text, document_hash, None
+    return data.get(text_field, ''), None, None
+
+def document_handles(params):
+    # Document IDs and upload hashes are the same value; both names are returned
+    handles = {}
+    if params.get("resume_hash"):
+        handles["resumeId"] = handles["resumeHash"] = params["resume_hash"]
+    if params.get("job_description_hash"):
+        handles["jobDescriptionId"] = handles["jobDescriptionHash"] = params["job_description_hash"]
+    return handles
+
+# The generators raise on failure so the retry policy can classify the error;
+# generate_pitches_cached turns a final failure into the ["Error: ..."] response.
+
+@with_retries('hf')
+async def generate_pitches_hf(hf_token, model_name, resume, job_description):
     print(f"Received HF API key: {hf_token[:5]}...") # Print first 5 characters for security
-    try:
-        client = InferenceClient(
-            model=model_name,
-            token=hf_token,
-        )
+    client = llm_clients.async_hf_client(hf_token, model_name)
 
-        prompt = f"{SYSTEM_PROMPT}\n\nResume:\n{resume}\n\nJob Description:\n{job_description}\n\nGenerate the pitches:"
+    prompt = f"{SYSTEM_PROMPT}\n\nResume:\n{resume}\n\nJob Description:\n{job_description}\n\nGenerate the pitches:"
 
-        response = client.chat_completion(
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=1000,
-            stream=False,
-        )
-
-        full_response = response.choices[0].message.content
+    response = await client.chat_completion(
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=1000,
+        stream=False,
+    )
 
-        pitches = []
-        for i in range(1, 4):
-            start = full_response.find(f"[PITCH{i}]") + len(f"[PITCH{i}]")
-            end = full_response.find(f"[/PITCH{i}]")
-            if start != -1 and end != -1:
-                pitches.append(full_response[start:end].strip())
+    full_response = response.choices[0].message.content
+
+    pitches = []
+    for i in range(1, 4):
+        start = full_response.find(f"[PITCH{i}]") + len(f"[PITCH{i}]")
+        end = full_response.find(f"[/PITCH{i}]")
+        if start != -1 and end != -1:
+            pitches.append(full_response[start:end].strip())
+
+    return pitches
+
+@with_retries('openai')
+async def generate_pitches_openai(api_key, resume, job_description):
+    client = llm_clients.async_openai_client(api_key)
+    chat_completion = await client.chat.completions.create(
+        model=OPENAI_MODEL,
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": f"Resume:\n{resume}\n\nJob Description:\n{job_description}"}
+        ]
+    )
+    content = chat_completion.choices[0].message.content
+    pitches = []
+    for i in range(1, 4):
+        start = content.find(f"[PITCH{i}]") + len(f"[PITCH{i}]")
+        end = content.find(f"[/PITCH{i}]")
+        if start != -1 and end != -1:
+            pitches.append(content[start:end].strip())
+    return pitches
+
+def pitch_cache_key(api_type, model_name, resume, job_description):
+    model = OPENAI_MODEL if api_type == 'openai' else model_name
+    return cache.hash_key(
+        cache.normalize_text(resume),
+        cache.normalize_text(job_description),
+        api_type,
+        model,
+        SYSTEM_PROMPT_VERSION,
+    )
 
+def is_successful_pitches(pitches):
+    return bool(pitches) and not any(p.startswith("Error:") for p in pitches)
+
+def pitch_leg(api_type, api_key, model_name, resume, job_description):
+    # (label, coroutine factory) for Hedger.run; the label is "<apiType>:<model>"
+    if api_type == 'openai':
+        return f"openai:{OPENAI_MODEL}", lambda: generate_pitches_openai(api_key, resume, job_description)
+    return f"hf:{model_name}", lambda: generate_pitches_hf(api_key, model_name, resume, job_description)
+
+def hedge_alternate(api_type, api_key, model_name, is_trial_mode=False):
+    # Returns (api_type, api_key, model_name) for the hedge request, or None.
+    # The user's key is reused for the same provider. Another provider needs a server
+    # key, which must never stand in for a request made with the user's own key.
+    alternate = PITCH_HEDGE_ALTERNATES.get(api_type)
+    if not PITCH_HEDGE_ENABLED or not alternate:
+        return None
+    alt_type, _, alt_model = alternate.partition(':')
+    if alt_type == api_type:
+        alt_key = api_key
+    elif not is_trial_mode:
+        return None
+    elif alt_type == 'openai':
+        alt_key = OPENAI_API_KEY
+    else:
+        alt_key = HF_API_TOKEN
+    if alt_type not in ('openai', 'hf') or not alt_key or (alt_type == 'hf' and not alt_model):
+        return None
+    if alt_type == api_type and (alt_type == 'openai' or alt_model == model_name):
+        return None
+    return alt_type, alt_key, alt_model
+
+async def generate_pitches_cached(api_type, api_key, model_name, resume, job_description, is_trial_mode=False):
+    # Returns (pitches, cached, shared). Only successful generations are stored.
+    # shared is True when this request attached to an identical in-flight generation
+    # (double clicks, client retries) instead of starting its own upstream call.
+    key = pitch_cache_key(api_type, model_name, resume, job_description)
+    pitches = pitch_cache.get(key)
+    if pitches is not None:
+        logger.info(f"Pitch cache hit for {api_type}")
+        return pitches, True, False
+
+    async def generate():
+        primary = pitch_leg(api_type, api_key, model_name, resume, job_description)
+        alternate = hedge_alternate(api_type, api_key, model_name, is_trial_mode)
+        if alternate:
+            alternate = pitch_leg(*alternate, resume, job_description)
+        try:
+            with retry.deadline(LLM_REQUEST_DEADLINE):
+                pitches, served_by = await pitch_hedger.run(primary, alternate)
+        except Exception as e:
+            print(f"Error generating pitches with {api_type}: {str(e)}")
+            print(traceback.format_exc())
+            return [f"Error: {str(e)}"]
+
+        if is_successful_pitches(pitches):
+            # Stored under the provider/model that actually produced the pitches
+            served_type, _, served_model = served_by.partition(':')
+            pitch_cache.set(pitch_cache_key(served_type, served_model, resume, job_description), pitches)
         return pitches
-    except Exception as e:
-        print(f"Error generating pitches with Hugging Face: {str(e)}")
-        print(traceback.format_exc())
-        return [f"Error: {str(e)}"]
 
-@retry_with_backoff(retries=3)
-def generate_pitches_openai(api_key, resume, job_description):
-    client = OpenAI(api_key=api_key)
-    try:
-        chat_completion = client.chat.completions.create(
-            model="gpt-3.5-turbo-0125",
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": f"Resume:\n{resume}\n\nJob Description:\n{job_description}"}
-            ]
-        )
-        content = chat_completion.choices[0].message.content
-        pitches = []
-        for i in range(1, 4):
-            start = content.find(f"[PITCH{i}]") + len(f"[PITCH{i}]")
-            end = content.find(f"[/PITCH{i}]")
-            if start != -1 and end != -1:
-                pitches.append(content[start:end].strip())
-        return pitches
-    except Exception as e:
-        print(f"Error generating pitches with OpenAI: {str(e)}")
-        return [f"Error: {str(e)}"]
+    # The key fingerprint keeps one user's bad key from failing another user's request
+    flight_key = (key, llm_clients.key_fingerprint(api_key))
+    pitches, shared = await pitch_flight.do(flight_key, generate)
+    return pitches, False, shared
 
 @app.route('/')
 def home():
@@ -183,106 +505,471 @@ def home():
 @app.route('/validate-api-key', methods=['POST'])
 def api_validate_api_key():
     print("Received request to validate API key")
-    data = request.json
-    print(f"Request data: {data}")
+    body, status = event_loop.run(handle_validate_api_key(request.json))
+    return jsonify(body), status
+
+async def handle_validate_api_key(data):
     api_key = data.get('apiKey', '')
+    api_type = data.get('apiType', 'openai')
 
     if not api_key:
         print("No API key provided")
-        return jsonify({"error": "API key is required"}), 400
+        return {"error": "API key is required"}, 400
 
-    print("Validating API key")
-    is_valid = validate_api_key(api_key)
+    if api_type not in ('openai', 'hf'):
+        return {"error": "Invalid API type"}, 400
+
+    print(f"Validating {api_type} API key (first 5 chars): {api_key[:5]}...")
+    is_valid, cached = await validate_api_key(api_key, api_type)
     print(f"API key is valid: {is_valid}")
-    return jsonify({"isValid": is_valid})
+    return {"isValid": is_valid, "cached": cached}, 200
+
+def parse_pitch_request(data, files):
+    # Shared by the blocking and streaming pitch endpoints.
+    # Returns (params, None) or (None, (error_body, status)).
+    is_trial_mode = data.get('isTrialMode') == 'true'
+    api_type = data.get('apiType', 'openai')
+    user_api_key = data.get('apiKey', '')
+    user_id = data.get('userId', '')
+    model_name = data.get('modelName', 'meta-llama/Meta-Llama-3-8B-Instruct')
+
+    print(f"Received API Type: {api_type}")
+    print(f"Received API key (first 5 chars): {user_api_key[:5]}...")
+
+    # Handle file uploads (or hashes of earlier uploads) for resume and job description
+    resume, resume_hash, error = resolve_document(
+        data, files, 'resumeFile', ('resumeId', 'resumeHash'), 'resume', 'resume')
+    if error:
+        return None, error
+
+    job_description, job_description_hash, error = resolve_document(
+        data, files, 'jobDescriptionFile', ('jobDescriptionId', 'jobDescriptionHash'),
+        'jobDescription', 'job description')
+    if error:
+        return None, error
+
+    if not resume or not job_description:
+        return None, ({"error": "Both job description and resume are required"}, 400)
+
+    if not user_id:
+        return None, ({"error": "User ID is required"}, 400)
+
+    api_type, api_key, error = resolve_credentials(is_trial_mode, api_type, user_api_key, user_id)
+    if error:
+        return None, error
+
+    resume = select_resume_passages(resume, job_description)
+    if PROMPT_COMPACTION_ENABLED:
+        resume, job_description = compact_prompt_inputs(resume, job_description)
+
+    return {
+        "resume": resume,
+        "job_description": job_description,
+        "is_trial_mode": is_trial_mode,
+        "api_type": api_type,
+        "api_key": api_key,
+        "user_id": user_id,
+        "model_name": model_name,
+        "resume_hash": resume_hash,
+        "job_description_hash": job_description_hash,
+    }, None
+
+def resolve_credentials(is_trial_mode, api_type, user_api_key, user_id):
+    # Returns (api_type, api_key, error). Trial mode always uses the server OpenAI key.
+    # Initialize user trials if not exists
+    if user_id not in user_trials:
+        user_trials[user_id] = 3
+
+    #print(f"user trials: {user_trials[user_id]}\n")
+    if is_trial_mode:
+        if user_trials[user_id] <= 0:
+            return None, None, ({"error": "Free trials are exhausted. Please provide your own API key."}, 403)
+        api_key = OPENAI_API_KEY
+        api_type = 'openai'
+    else:
+        api_key = user_api_key
+
+    if api_type not in ('openai', 'hf'):
+        return None, None, ({"error": "Invalid API type"}, 400)
+    return api_type, api_key, None
+
+def select_resume_passages(resume, job_description):
+    if not RESUME_RELEVANCE_TOP_K or prompt_compaction.count_tokens(resume) < RESUME_RELEVANCE_MIN_TOKENS:
+        return resume
+    start = time.perf_counter()
+    selected, kept, total = relevance.resume_index(resume).select(job_description, RESUME_RELEVANCE_TOP_K)
+    logger.info(f"Resume relevance: kept {kept} of {total} passages "
+                f"in {(time.perf_counter() - start) * 1000:.1f} ms")
+    return selected
+
+def compact_prompt_inputs(resume, job_description):
+    resume, resume_before, resume_after = prompt_compaction.compact(
+        resume, RESUME_TOKEN_BUDGET, 'resume')
+    job_description, jd_before, jd_after = prompt_compaction.compact(
+        job_description, JOB_DESCRIPTION_TOKEN_BUDGET, 'job_description')
+    logger.info(f"Prompt compaction: resume {resume_before} -> {resume_after} tokens, "
+                f"job description {jd_before} -> {jd_after} tokens")
+    return resume, job_description
+
+def request_data(req=None):
+    req = req or request
+    # Don't try to access request.json for multipart form data
+    if req.content_type and req.content_type.startswith('multipart/form-data'):
+        return req.form
+    elif req.is_json:
+        return req.json
+    return None
 
 @app.route('/generate-pitches', methods=['POST'])
 def api_generate_pitches():
     try:
         #print("Request form data:", request.form)
         #print("Request files:", request.files)
-        
-        # Don't try to access request.json for multipart form data
-        if request.content_type.startswith('multipart/form-data'):
-            data = request.form
-        elif request.is_json:
-            data = request.json
-        else:
+        data = request_data()
+        if data is None:
             return jsonify({"error": "Unsupported Media Type"}), 415
 
-        resume = ''
-        job_description = ''
-        is_trial_mode = data.get('isTrialMode') == 'true'
-        api_type = data.get('apiType', 'openai')
-        API_TYPE = api_type
-        user_api_key = data.get('apiKey', '')
-        user_id = data.get('userId', '')
-        model_name = data.get('modelName', 'meta-llama/Meta-Llama-3-8B-Instruct')
-
-        print(f"Received API Type: {api_type}")
-        print(f"Received API key (first 5 chars): {user_api_key[:5]}...")
-
-        # Handle file uploads for resume
-        if 'resumeFile' in request.files:
-            pdf_file = request.files['resumeFile'].read()
-            resume_text = extract_text_from_pdf(pdf_file)
-            if resume_text is None:
-                return jsonify({"error": "Failed to read resume PDF file"}), 400
-            resume = resume_text
-        elif 'resume' in data:
-            resume = data.get('resume', '')
-
-        # Handle file uploads for job description
-        if 'jobDescriptionFile' in request.files:
-            pdf_file = request.files['jobDescriptionFile'].read()
-            job_description_text = extract_text_from_pdf(pdf_file)
-            if job_description_text is None:
-                return jsonify({"error": "Failed to read job description PDF file"}), 400
-            job_description = job_description_text
-        elif 'jobDescription' in data:
-            job_description = data.get('jobDescription', '')
-
-        if not resume or not job_description:
-            return jsonify({"error": "Both job description and resume are required"}), 400
+        params, error = parse_pitch_request(data, request.files)
+        if error:
+            return jsonify(error[0]), error[1]
 
-        if not user_id:
-            return jsonify({"error": "User ID is required"}), 400
-
-        # Initialize user trials if not exists
-        if user_id not in user_trials:
-            user_trials[user_id] = 3
+        body, status = event_loop.run(handle_generate_pitches(params))
+        return jsonify(body), status
+    except Exception as e:
+        print(f"Unexpected error: {str(e)}")
+        print(traceback.format_exc())
+        return jsonify(
+            {"error": f"An unexpected error occurred: {str(e)}"}), 500
 
-        #print(f"user trials: {user_trials[user_id]}\n")
-        if is_trial_mode:
-            if user_trials[user_id] <= 0:
-                return jsonify({"error": "Free trials are exhausted. Please provide your own API key."}), 403
-            api_key = OPENAI_API_KEY
-            api_type = 'openai'
-        else:
-            api_key = user_api_key
+# Route handlers shared by the Flask views and the async serving mode (asgi.py).
+# They take already-parsed request data and return (body, status).
+
+async def handle_generate_pitches(params):
+    user_id = params["user_id"]
+
+    # Generate pitches based on API type, served from the cache when possible
+    pitches, cached, shared = await generate_pitches_cached(
+        params["api_type"], params["api_key"], params["model_name"],
+        params["resume"], params["job_description"], params["is_trial_mode"])
+
+    # Only decrement trial if pitches were freshly generated, and only once per upstream call
+    if params["is_trial_mode"] and is_successful_pitches(pitches) and not cached and not shared:
+        user_trials[user_id] -= 1
+
+    return {
+        "pitches": pitches, 
+        "trialsRemaining": max(0, user_trials[user_id]),
+        "cached": cached,
+        "coalesced": shared,
+        **document_handles(params)
+    }, 200
+
+def stream_completion_openai(api_key, resume, job_description):
+    client = llm_clients.openai_client(api_key)
+    stream = client.chat.completions.create(
+        model=OPENAI_MODEL,
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": f"Resume:\n{resume}\n\nJob Description:\n{job_description}"}
+        ],
+        stream=True,
+    )
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+def stream_completion_hf(hf_token, model_name, resume, job_description):
+    client = llm_clients.hf_client(hf_token, model_name)
+    prompt = f"{SYSTEM_PROMPT}\n\nResume:\n{resume}\n\nJob Description:\n{job_description}\n\nGenerate the pitches:"
+    stream = client.chat_completion(
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=1000,
+        stream=True,
+    )
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+def stream_pitch_events(params):
+    user_id = params["user_id"]
+    api_type = params["api_type"]
+    key = pitch_cache_key(api_type, params["model_name"], params["resume"], params["job_description"])
+
+    cached_pitches = pitch_cache.get(key)
+    if cached_pitches is not None:
+        for i, pitch in enumerate(cached_pitches, start=1):
+            yield sse_event("pitch", {"index": i, "pitch": pitch})
+        yield sse_event("done", {
+            "pitches": cached_pitches,
+            "trialsRemaining": max(0, user_trials[user_id]),
+            "cached": True,
+            **document_handles(params)
+        })
+        return
 
-        # Generate pitches based on API type
+    parser = PitchStreamParser()
+    breaker = retry.breakers[api_type]
+    try:
+        breaker.before_call()
         if api_type == 'openai':
-            pitches = generate_pitches_openai(api_key, resume, job_description)
-        elif api_type == 'hf':
-            pitches = generate_pitches_hf(api_key, model_name, resume, job_description)
+            tokens = stream_completion_openai(params["api_key"], params["resume"], params["job_description"])
         else:
-            return jsonify({"error": "Invalid API type"}), 400
-
-        # Only decrement trial if pitches were successfully generated
-        if is_trial_mode and pitches != []:
+            tokens = stream_completion_hf(params["api_key"], params["model_name"], params["resume"], params["job_description"])
+
+        for token in tokens:
+            yield sse_event("token", {"text": token, "pitchIndex": parser.current})
+            for pitch in parser.feed(token):
+                yield sse_event("pitch", pitch)
+        for pitch in parser.close():
+            yield sse_event("pitch", pitch)
+        breaker.record_success()
+    except Exception as e:
+        print(f"Error streaming pitches with {api_type}: {str(e)}")
+        print(traceback.format_exc())
+        if retry.classify_error(e).provider_failure:
+            breaker.record_failure()
+        yield sse_event("error", {"error": f"Error: {str(e)}"})
+        return
+
+    pitches = parser.pitches
+    if is_successful_pitches(pitches):
+        pitch_cache.set(key, pitches)
+        if params["is_trial_mode"]:
             user_trials[user_id] -= 1
 
-        return jsonify({
-            "pitches": pitches, 
-            "trialsRemaining": max(0, user_trials[user_id])
-        })
+    yield sse_event("done", {
+        "pitches": pitches,
+        "trialsRemaining": max(0, user_trials[user_id]),
+        "cached": False,
+        **document_handles(params)
+    })
+
+@app.route('/generate-pitches/stream', methods=['POST'])
+def api_generate_pitches_stream():
+    try:
+        data = request_data()
+        if data is None:
+            return jsonify({"error": "Unsupported Media Type"}), 415
+
+        # Uploads are parsed before the response starts so validation errors stay plain JSON
+        params, error = parse_pitch_request(data, request.files)
+        if error:
+            return jsonify(error[0]), error[1]
+
+        return Response(
+            stream_with_context(stream_pitch_events(params)),
+            mimetype='text/event-stream',
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+    except Exception as e:
+        print(f"Unexpected error: {str(e)}")
+        print(traceback.format_exc())
+        return jsonify(
+            {"error": f"An unexpected error occurred: {str(e)}"}), 500
+
+def list_field(data, name):
+    # Repeated multipart fields or a JSON list
+    if hasattr(data, 'getlist'):
+        return [value for value in data.getlist(name) if value]
+    value = data.get(name)
+    if not value:
+        return []
+    return [v for v in value if v] if isinstance(value, list) else [value]
+
+def parse_batch_request(data, files):
+    # Job descriptions come as PDFs ("jobDescriptionFiles"), document IDs
+    # ("jobDescriptionIds") and/or texts ("jobDescriptions"), indexed in that order.
+    # Returns (params, None) or (None, (error_body, status)).
+    is_trial_mode = data.get('isTrialMode') == 'true'
+    user_id = data.get('userId', '')
+    model_name = data.get('modelName', 'meta-llama/Meta-Llama-3-8B-Instruct')
+
+    resume, resume_hash, error = resolve_document(
+        data, files, 'resumeFile', ('resumeId', 'resumeHash'), 'resume', 'resume')
+    if error:
+        return None, error
+
+    pdf_files = files.getlist('jobDescriptionFiles') if hasattr(files, 'getlist') else []
+    document_ids = [str(value).lower() for value in list_field(data, 'jobDescriptionIds')]
+    texts = list_field(data, 'jobDescriptions')
+    if not pdf_files and not document_ids and not texts:
+        return None, ({"error": "At least one job description is required"}, 400)
+    if len(pdf_files) + len(document_ids) + len(texts) > BATCH_MAX_JOB_DESCRIPTIONS:
+        return None, ({"error": f"At most {BATCH_MAX_JOB_DESCRIPTIONS} job descriptions per batch"}, 400)
+    if not resume:
+        return None, ({"error": "Resume is required"}, 400)
+    if not user_id:
+        return None, ({"error": "User ID is required"}, 400)
+
+    job_descriptions = []
+    extracted = extract_documents([pdf_file.read() for pdf_file in pdf_files])
+    for pdf_file, (text, document_hash) in zip(pdf_files, extracted):
+        if text is None:
+            return None, ({"error": f"Failed to read job description PDF file {pdf_file.filename}"}, 400)
+        job_descriptions.append((text, document_hash))
+    for document_id in document_ids:
+        text = lookup_document(document_id) if is_document_hash(document_id) else None
+        if text is None:
+            return None, ({"error": f"Unknown jobDescriptionId {document_id}, please upload the job description again"}, 404)
+        job_descriptions.append((text, document_id))
+    for text in texts:
+        job_descriptions.append(store_text_document(str(text)))
+
+    api_type, api_key, error = resolve_credentials(
+        is_trial_mode, data.get('apiType', 'openai'), data.get('apiKey', ''), user_id)
+    if error:
+        return None, error
+
+    # Each job gets its own resume selection; the resume's index is built once and shared
+    jobs = []
+    for i, (text, document_hash) in enumerate(job_descriptions):
+        job_resume = select_resume_passages(resume, text)
+        if PROMPT_COMPACTION_ENABLED:
+            job_resume, text = compact_prompt_inputs(job_resume, text)
+        jobs.append({"index": i, "resume": job_resume, "job_description": text, "job_description_hash": document_hash})
+
+    return {
+        "resume_hash": resume_hash,
+        "job_descriptions": jobs,
+        "is_trial_mode": is_trial_mode,
+        "api_type": api_type,
+        "api_key": api_key,
+        "user_id": user_id,
+        "model_name": model_name,
+    }, None
+
+async def generate_batch(params, jobs, emit):
+    # Runs every job with at most BATCH_CONCURRENCY generations in flight and calls
+    # emit(result) as each one completes. Every job emits exactly one result.
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def run(job):
+        result = {"index": job["index"], "jobDescriptionId": job["job_description_hash"]}
+        try:
+            async with semaphore:
+                pitches, cached, shared = await generate_pitches_cached(
+                    params["api_type"], params["api_key"], params["model_name"],
+                    job["resume"], job["job_description"], params["is_trial_mode"])
+            result.update({"pitches": pitches, "cached": cached, "coalesced": shared})
+        except Exception as e:
+            print(f"Error generating batch pitches: {str(e)}")
+            print(traceback.format_exc())
+            result["error"] = f"Error: {str(e)}"
+        emit(result)
+
+    await asyncio.gather(*[run(job) for job in jobs])
+
+async def stream_batch_events(params):
+    # Async generator of SSE strings, driven on whichever loop serves the request (the
+    # ASGI worker's loop, or event_loop's under Flask) so its generations share
+    # pitch_flight with /generate-pitches on that loop.
+    # Trial accounting: a batch reserves one trial per job description up front (as many
+    # as remain), jobs beyond the reservation fail with the trials-exhausted error, and
+    # only results taken by the client with freshly generated pitches are charged.
+    # Cache hits, coalesced requests and failures are free, as for single requests, and
+    # a client that disconnects gets back the trials of every job it didn't receive.
+    user_id = params["user_id"]
+    jobs = params["job_descriptions"]
+    reserved = len(jobs)
+    if params["is_trial_mode"]:
+        reserved = min(len(jobs), max(0, user_trials[user_id]))
+        user_trials[user_id] -= reserved
+
+    succeeded = 0
+    charged = 0
+    task = None
+    try:
+        for job in jobs[reserved:]:
+            yield sse_event("result", {
+                "index": job["index"],
+                "jobDescriptionId": job["job_description_hash"],
+                "error": "Free trials are exhausted. Please provide your own API key."
+            })
+
+        results = asyncio.Queue()
+        task = asyncio.ensure_future(generate_batch(params, jobs[:reserved], results.put_nowait))
+        for _ in range(reserved):
+            result = await results.get()
+            fresh = is_successful_pitches(result.get("pitches")) and not result.get("cached") and not result.get("coalesced")
+            succeeded += is_successful_pitches(result.get("pitches"))
+            charged += fresh
+            yield sse_event("result", result)
+    finally:
+        # Stops generations that haven't finished if the client went away
+        if task is not None:
+            task.cancel()
+        if params["is_trial_mode"]:
+            user_trials[user_id] += reserved - charged
+
+    yield sse_event("done", {
+        "count": len(jobs),
+        "succeeded": succeeded,
+        "trialsRemaining": max(0, user_trials[user_id]),
+        **document_handles(params)
+    })
+
+@app.route('/generate-pitches/batch', methods=['POST'])
+def api_generate_pitches_batch():
+    # Server-sent events: one "result" per job description as it completes, then "done"
+    try:
+        data = request_data()
+        if data is None:
+            return jsonify({"error": "Unsupported Media Type"}), 415
+
+        params, error = parse_batch_request(data, request.files)
+        if error:
+            return jsonify(error[0]), error[1]
+
+        return Response(
+            stream_with_context(event_loop.iterate(stream_batch_events(params))),
+            mimetype='text/event-stream',
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
     except Exception as e:
         print(f"Unexpected error: {str(e)}")
         print(traceback.format_exc())
         return jsonify(
             {"error": f"An unexpected error occurred: {str(e)}"}), 500
 
+@app.route('/documents', methods=['POST'])
+def api_create_document():
+    # Upload a resume or job description once (PDF as "file", or plain "text") and
+    # reference it from /generate-pitches as resumeId / jobDescriptionId.
+    # Documents live in the document cache, so an ID can expire (404 on use).
+    try:
+        data = request_data() or {}
+        if 'file' in request.files:
+            text, document_id = extract_document(request.files['file'].read())
+            if text is None:
+                return jsonify({"error": "Failed to read PDF file"}), 400
+        elif data.get('text'):
+            text, document_id = store_text_document(data.get('text'))
+        else:
+            return jsonify({"error": "A PDF file or text is required"}), 400
+
+        if not text:
+            return jsonify({"error": "No text could be extracted from the document"}), 422
+
+        return jsonify({"id": document_id, "characters": len(text)}), 201
+    except Exception as e:
+        print(f"Unexpected error: {str(e)}")
+        print(traceback.format_exc())
+        return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
+
+@app.route('/documents/<document_id>', methods=['GET'])
+def api_get_document(document_id):
+    document_id = document_id.lower()
+    text = lookup_document(document_id) if is_document_hash(document_id) else None
+    if text is None:
+        return jsonify({"error": "Document not found"}), 404
+    return jsonify({"id": document_id, "characters": len(text)}), 200
+
+@app.route('/cache-stats', methods=['GET'])
+def api_cache_stats():
+    stats = cache.all_stats()
+    stats["circuits"] = retry.stats()
+    return jsonify(stats)
+
 @app.route('/submit-investor-form', methods=['POST'])
 def submit_investor_form():
     try:
@@ -332,44 +1019,239 @@ def submit_investor_form():
         print(f"Error submitting investor form: {str(e)}")
         return jsonify({"error": f"An error occurred: {str(e)}"}), 500
         
+# Formats /generate-audio can return, chosen from ?format= or the Accept header.
+# JSON (base64 WAV) stays the default, so existing clients and "Accept: */*" are unchanged.
+AUDIO_FORMATS = {
+    'application/json': None,
+    'audio/wav': ('wav', {}),
+    'audio/mpeg': ('mp3', {'bitrate': os.getenv('AUDIO_MP3_BITRATE', '64k')}),
+    'audio/ogg': ('ogg', {'codec': 'libopus', 'bitrate': os.getenv('AUDIO_OPUS_BITRATE', '32k')}),
+}
+AUDIO_FORMAT_ALIASES = {'json': 'application/json', 'wav': 'audio/wav', 'mp3': 'audio/mpeg',
+                        'ogg': 'audio/ogg', 'opus': 'audio/ogg'}
+
+class RawResponse:
+    # A non-JSON handler result: the Flask views and asgi.py send it as-is
+    def __init__(self, content, mimetype, headers=None):
+        self.content = content
+        self.mimetype = mimetype
+        self.headers = headers or {}
+
+def negotiate_audio_format(req=None):
+    # Returns the response mimetype, or None if the requested format isn't supported
+    req = req or request
+    requested = req.args.get('format')
+    if requested:
+        return AUDIO_FORMAT_ALIASES.get(requested.lower())
+    return req.accept_mimetypes.best_match(list(AUDIO_FORMATS), default='application/json')
+
+def encode_audio(wav_data, mimetype):
+    # Returns (bytes, mimetype); falls back to WAV if ffmpeg can't produce the encoding
+    audio_format, options = AUDIO_FORMATS[mimetype]
+    wav_data = bytes(wav_data)
+    if audio_format == 'wav':
+        return wav_data, mimetype
+    try:
+        segment = AudioSegment.from_wav(io.BytesIO(wav_data))
+        return segment.export(format=audio_format, **options).read(), mimetype
+    except Exception as e:
+        logger.warning(f"Could not encode audio as {audio_format}, sending WAV: {str(e)}")
+        return wav_data, 'audio/wav'
+
 @app.route('/generate-audio', methods=['POST'])
 def generate_audio():
-    data = request.json
+    mimetype = negotiate_audio_format()
+    if mimetype is None:
+        return jsonify({"error": "Unsupported audio format"}), 406
+    body, status = event_loop.run(handle_generate_audio(request.json, mimetype, request.if_none_match))
+    if isinstance(body, RawResponse):
+        return Response(body.content, status=status, mimetype=body.mimetype, headers=body.headers)
+    return jsonify(body), status
+
+@app.route('/generate-audio/stream', methods=['POST'])
+def generate_audio_stream():
+    # Server-sent events; the browser can start playing the first chunk while EVI is
+    # still synthesizing the rest
+    data = request.json or {}
     pitch_text = data.get('pitchText')
-    
     if not pitch_text:
         return jsonify({"error": "No pitch text provided"}), 400
 
+    return Response(
+        stream_with_context(event_loop.iterate(stream_audio(pitch_text))),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def audio_cache_key(pitch_text):
+    return cache.hash_key(cache.normalize_text(pitch_text), HUME_EVI_CONFIG_ID)
+
+def cached_audio(audio_id):
+    # Returns {"wav", "text", "etag"} or None. The WAV is stored as a BLOB next to its metadata.
+    meta = audio_cache.get(f"{audio_id}:meta")
+    wav = audio_cache.get(audio_id) if meta else None
+    if wav is None:
+        return None
+    return {"wav": wav, "text": meta["text"], "etag": meta["etag"]}
+
+def audio_entry(wav, text):
+    wav = bytes(wav)
+    return {"wav": wav, "text": text, "etag": hashlib.sha256(wav).hexdigest()[:32]}
+
+def store_audio(audio_id, wav, text):
+    entry = audio_entry(wav, text)
+    audio_cache.set(audio_id, entry["wav"])
+    audio_cache.set(f"{audio_id}:meta", {"text": text, "etag": entry["etag"]})
+    return entry
+
+async def synthesize_audio_cached(pitch_text):
+    # Returns (audio_id, entry or None, error_text, cached). Identical concurrent
+    # requests (double clicks on "Listen") share one EVI synthesis. A reply cut off
+    # before assistant_end is still returned but not cached, and audio_id is None.
+    audio_id = audio_cache_key(pitch_text)
+    entry = cached_audio(audio_id)
+    if entry is not None:
+        logger.info("Audio cache hit")
+        return audio_id, entry, None, True
+
+    async def synthesize():
+        audio_data, text_response, complete = await generate_audio_async(pitch_text)
+        if not audio_data:
+            return None, text_response, False
+        if not complete:
+            logger.warning("Not caching audio: the EVI reply ended before assistant_end")
+            return audio_entry(audio_data, text_response), None, False
+        return store_audio(audio_id, audio_data, text_response), None, True
+
+    (entry, error, stored), _ = await audio_flight.do(audio_id, synthesize)
+    return audio_id if stored else None, entry, error, False
+
+async def audio_response(audio_id, entry, mimetype, if_none_match=None):
+    # Raw audio body with validators; the transcript goes in a percent-encoded header.
+    # Encoded variants are cached next to the WAV so ffmpeg runs once per format.
+    etag = entry["etag"] if mimetype == 'audio/wav' else f"{entry['etag']}-{AUDIO_FORMATS[mimetype][0]}"
+    headers = {
+        AUDIO_TEXT_HEADER: urllib.parse.quote(entry["text"].strip()),
+        "ETag": f'"{etag}"',
+        # Revalidate every time: the ETag answers with a bodiless 304 when nothing changed
+        "Cache-Control": "private, no-cache",
+    }
+    if audio_id:
+        headers[AUDIO_ID_HEADER] = audio_id
+    if if_none_match is not None and if_none_match.contains(etag):
+        return RawResponse(b'', mimetype, headers), 304
+
+    content_type = mimetype
+    content = None
+    if mimetype == 'audio/wav':
+        content = entry["wav"]
+    elif audio_id:
+        content = audio_cache.get(f"{audio_id}:{mimetype}")
+    if content is None:
+        content, content_type = await asyncio.to_thread(encode_audio, entry["wav"], mimetype)
+        if content_type == mimetype and audio_id:
+            audio_cache.set(f"{audio_id}:{mimetype}", content)
+        else:
+            headers["ETag"] = f'"{entry["etag"]}"'
+    return RawResponse(content, content_type, headers), 200
+
+@app.route('/audio/<audio_id>', methods=['GET'])
+def get_audio(audio_id):
+    # Cached pitch audio by the audioId /generate-audio returned; 404 once evicted
+    mimetype = negotiate_audio_format()
+    if mimetype is None:
+        return jsonify({"error": "Unsupported audio format"}), 406
+    entry = cached_audio(audio_id) if is_document_hash(audio_id) else None
+    if entry is None:
+        return jsonify({"error": "Audio not found"}), 404
+    if mimetype == 'application/json':
+        mimetype = 'audio/wav'
+    body, status = event_loop.run(audio_response(audio_id, entry, mimetype, request.if_none_match))
+    return Response(body.content, status=status, mimetype=body.mimetype, headers=body.headers)
+
+async def handle_generate_audio(data, mimetype='application/json', if_none_match=None):
+    pitch_text = data.get('pitchText')
+    
+    if not pitch_text:
+        return {"error": "No pitch text provided"}, 400
+
     try:
-        audio_data, text_response = asyncio.run(generate_audio_async(pitch_text))
+        audio_id, entry, error, cached = await synthesize_audio_cached(pitch_text)
         
-        if audio_data:
-            return jsonify({
-                "audioData": base64.b64encode(audio_data).decode('utf-8'),
-                "textResponse": text_response
-            })
+        if entry and mimetype != 'application/json':
+            return await audio_response(audio_id, entry, mimetype, if_none_match)
+        if entry:
+            return {
+                "audioData": base64.b64encode(entry["wav"]).decode('utf-8'),
+                "textResponse": entry["text"],
+                "audioId": audio_id,
+                "cached": cached
+            }, 200
         else:
-            return jsonify({"error": text_response}), 500
+            return {"error": error}, 500
 
     except Exception as e:
         print(f"Error generating audio: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+        return {"error": str(e)}, 500
 
 async def generate_audio_async(pitch_text):
     try:
-        websocket = await connect_to_evi()
-        if not websocket:
-            return None, "Failed to connect to Hume AI EVI Chat API"
-
-        await send_message(websocket, pitch_text)
-        audio_data, text_response = await receive_audio(websocket)
-        await websocket.close()
-
-        return audio_data, text_response
+        async with evi_pool.session() as websocket:
+            await send_message(websocket, pitch_text)
+            return await receive_audio(websocket)
     except Exception as e:
         print(f"Error generating audio: {str(e)}")
-        return None, str(e)
+        return None, str(e), False
     
+async def stream_audio(pitch_text):
+    # Async generator of SSE strings: "audio" events ({index, audioData} with one
+    # base64 WAV chunk each) interleaved with "text" events, then "done" or "error".
+    # Cached audio is sent as a single chunk; fresh audio is cached once EVI sends
+    # assistant_end (a cut-off reply gets audioId null).
+    audio_id = audio_cache_key(pitch_text)
+    entry = cached_audio(audio_id)
+    if entry is not None:
+        yield sse_event("text", {"text": entry["text"].strip()})
+        yield sse_event("audio", {"index": 0, "audioData": base64.b64encode(entry["wav"]).decode('utf-8')})
+        yield sse_event("done", {"chunks": 1, "textResponse": entry["text"], "audioId": audio_id, "cached": True})
+        return
+
+    try:
+        # A client that disconnects mid-stream closes the session instead of returning it
+        async with evi_pool.session() as websocket:
+            await send_message(websocket, pitch_text)
+            audio_chunks = []
+            text_response = ""
+            complete = False
+            async for kind, payload in evi_events(websocket):
+                if kind == "audio":
+                    yield sse_event("audio", {"index": len(audio_chunks), "audioData": base64.b64encode(payload).decode('utf-8')})
+                    audio_chunks.append(payload)
+                elif kind == "text":
+                    text_response += payload + " "
+                    yield sse_event("text", {"text": payload})
+                else:
+                    complete = True
+
+        if audio_chunks:
+            stored = False
+            if complete:
+                try:
+                    store_audio(audio_id, concat_wav_chunks(audio_chunks), text_response)
+                    stored = True
+                except ValueError as e:
+                    logger.warning(f"Not caching streamed audio: {str(e)}")
+            else:
+                logger.warning("Not caching streamed audio: the EVI reply ended before assistant_end")
+            yield sse_event("done", {"chunks": len(audio_chunks), "textResponse": text_response,
+                                     "audioId": audio_id if stored else None, "cached": False})
+        else:
+            print("No audio data received")
+            yield sse_event("error", {"error": text_response or "No audio data received"})
+    except Exception as e:
+        print(f"Error streaming audio: {str(e)}")
+        yield sse_event("error", {"error": str(e)})
+
 async def send_message(websocket, message):
     assistant_input = {
         "type": "assistant_input",
@@ -378,11 +1260,10 @@ async def send_message(websocket, message):
     await websocket.send(json.dumps(assistant_input))
     print(f"Message sent: {message}")
 
-async def receive_audio(websocket):
-    print("Waiting for audio response...")
-    audio_chunks = []
-    text_response = ""
-    
+async def evi_events(websocket):
+    # Yields ("audio", wav_bytes) and ("text", content) as EVI sends them, then ("end", None)
+    # on assistant_end. If the socket drops first the generator just stops, so a reply
+    # is complete only if "end" was seen. Every audio_output chunk is a playable WAV file.
     try:
         while True:
             response = await websocket.recv()
@@ -390,169 +1271,274 @@ async def receive_audio(websocket):
             print(f"Received response of type: {data['type']}")
             
             if data["type"] == "audio_output":
-                audio_chunks.append(base64.b64decode(data["data"]))
+                yield "audio", base64.b64decode(data["data"])
             elif data["type"] == "assistant_message":
-                text_response += data['message']['content'] + " "
+                yield "text", data['message']['content']
             elif data["type"] == "assistant_end":
                 print("Received end of assistant response")
+                yield "end", None
                 break
             else:
                 print(f"Received other message type: {data['type']}")
     
     except websockets.exceptions.ConnectionClosedError:
         print("Connection closed unexpectedly. The complete message may not have been received.")
+
+async def receive_audio(websocket):
+    print("Waiting for audio response...")
+    # Returns (audio_data or None, text_response, complete)
+    audio_chunks = []
+    text_response = ""
+    complete = False
+
+    async for kind, payload in evi_events(websocket):
+        if kind == "audio":
+            audio_chunks.append(payload)
+        elif kind == "text":
+            text_response += payload + " "
+        else:
+            complete = True
     
     if audio_chunks:
-        combined_audio = AudioSegment.empty()
-        for chunk in audio_chunks:
-            segment = AudioSegment.from_wav(io.BytesIO(chunk))
-            combined_audio += segment
-        
-        audio_data = combined_audio.export(format="wav").read()
-        return audio_data, text_response
+        try:
+            audio_data = concat_wav_chunks(audio_chunks)
+        except ValueError as e:
+            # Not plain PCM WAV: decode and re-encode through pydub
+            logger.warning(f"Falling back to pydub for EVI audio: {str(e)}")
+            combined_audio = AudioSegment.empty()
+            for chunk in audio_chunks:
+                combined_audio += AudioSegment.from_wav(io.BytesIO(chunk))
+            audio_data = combined_audio.export(format="wav").read()
+        return audio_data, text_response, complete
     else:
         print("No audio data received")
-        return None, text_response
+        return None, text_response, complete
     
-async def connect_to_evi(max_retries=3, retry_delay=5):
+@with_retries('evi')
+async def open_evi_socket():
     uri = f"{API_URL}?api_key={API_KEY}"
-    for attempt in range(max_retries):
-        try:
-            websocket = await websockets.connect(uri)
-            print("Connected to Hume AI EVI Chat API")
-            return websocket
-        except Exception as e:
-            print(f"Connection attempt {attempt + 1} failed: {e}")
-            if attempt < max_retries - 1:
-                print(f"Retrying in {retry_delay} seconds...")
-                await asyncio.sleep(retry_delay)
-            else:
-                print("Max retries reached. Unable to connect.")
-    return None
+    if HUME_EVI_CONFIG_ID:
+        uri += f"&config_id={HUME_EVI_CONFIG_ID}"
+    websocket = await websockets.connect(uri)
+    print("Connected to Hume AI EVI Chat API")
+    return websocket
+
+evi_pool = cache.register(EviPool(
+    'eviSessions',
+    open_evi_socket,
+    size=EVI_POOL_SIZE,
+    max_idle=EVI_POOL_MAX_IDLE,
+    max_age=EVI_POOL_MAX_AGE,
+    ping_interval=EVI_POOL_PING_INTERVAL,
+    first_reply_timeout=EVI_POOL_FIRST_REPLY_TIMEOUT,
+))
+
+# asgi.py serves audio on its own loop and warms that one, so it turns this off
+EVI_POOL_WARM_ON_REQUEST = True
+
+@app.before_request
+def warm_evi_pool():
+    # Each worker's first request starts filling the pool on the shared loop, so
+    # sessions are open by the time the user asks for audio
+    if EVI_POOL_WARM_ON_REQUEST:
+        evi_pool.warm(event_loop.get_loop())
 
 async def close_connection(websocket):
     if websocket:
         await websocket.close()
         logger.debug("WebSocket connection closed")
 
+_hume_client = None
+
+def get_hume_client():
+    # Shared across requests; the background event loop keeps it alive per worker
+    global _hume_client
+    if _hume_client is None:
+        _hume_client = HumeStreamClient(HUME_AI_API_KEY)
+    return _hume_client
+
 @app.route('/analyze-practice', methods=['POST'])
 def analyze_practice():
+    body, status = event_loop.run(handle_analyze_practice(request.files, request.form))
+    return jsonify(body), status
+
+async def handle_analyze_practice(files, form=None):
     try:
-        audio_file = request.files.get('audio')
-        video_file = request.files.get('video')
+        audio_file = files.get('audio')
+        video_file = files.get('video')
         
         if not audio_file or not video_file:
-            return jsonify({"error": "Both audio and video files are required"}), 400
+            return {"error": "Both audio and video files are required"}, 400
 
         logger.debug(f"Received audio file: {audio_file.filename}")
         logger.debug(f"Received video file: {video_file.filename}")
 
-        # Process audio and video files
-        audio_results = process_audio(audio_file)
-        video_results = process_video(video_file)
+        # Optional per-emotion mean/max/std/percentiles alongside topEmotions
+        form = form or {}
+        detailed = form.get('includeStats') == 'true'
+        # Optional downsampled per-window emotion vectors so the UI can chart without another request
+        timeline_windows = None
+        if form.get('includeTimeline') == 'true':
+            try:
+                timeline_windows = int(form.get('timelineWindows', TIMELINE_WINDOWS))
+            except ValueError:
+                return {"error": "timelineWindows must be an integer"}, 400
+            timeline_windows = max(1, min(timeline_windows, TIMELINE_MAX_WINDOWS))
+
+        # Prosody and face models are independent, so run them concurrently;
+        # latency becomes max(audio, video) instead of the sum
+        audio_results, video_results = await asyncio.gather(
+            run_analysis_branch("Audio", process_audio(audio_file, detailed, timeline_windows)),
+            run_analysis_branch("Video", process_video(video_file, detailed, timeline_windows)),
+        )
         
-        return jsonify({
+        return {
             "audioAnalysis": audio_results,
             "videoAnalysis": video_results
-        })
+        }, 200
     except Exception as e:
         logger.exception("Error in analyze_practice")
-        return jsonify({"error": str(e)}), 500
-
-def process_audio(audio_file):
-    client = HumeStreamClient(HUME_AI_API_KEY)
-    config = ProsodyConfig()
-    
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as temp_audio:
-        audio_file.save(temp_audio)
-        temp_audio_path = temp_audio.name
+        return {"error": str(e)}, 500
+    finally:
+        # Release spooled upload buffers (and any spilled temp files) right away
+        for upload in files.values():
+            upload.close()
 
+async def run_analysis_branch(label, coro, timeout=None):
+    # A slow or failing branch reports its own error instead of failing the whole request
+    timeout = HUME_ANALYSIS_TIMEOUT if timeout is None else timeout
     try:
-        result = asyncio.run(analyze_audio(client, config, temp_audio_path))
-        return aggregate_audio_results(result)
-    finally:
-        os.unlink(temp_audio_path)  # Delete the temporary file
+        return await asyncio.wait_for(coro, timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"{label} analysis timed out after {timeout} seconds")
+        return {"error": f"{label} analysis timed out."}
+    except Exception as e:
+        logger.exception(f"Error in {label.lower()} analysis")
+        return {"error": f"{label} analysis failed: {str(e)}"}
 
-def process_video(video_file):
-    client = HumeStreamClient(HUME_AI_API_KEY)
-    config = FaceConfig()
-    
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as temp_video:
-        video_file.save(temp_video)
-        temp_video_path = temp_video.name
+async def process_audio(audio_file, detailed=False, timeline_windows=None):
+    client = get_hume_client()
+    config = ProsodyConfig()
 
-    try:
-        result = asyncio.run(analyze_video(client, config, temp_video_path))
-        return aggregate_video_results(result)
-    finally:
-        os.unlink(temp_video_path)  # Delete the temporary file
+    # Reading a spilled upload and chunking it (possibly through ffmpeg) both block,
+    # keep them off the event loop
+    chunks = await asyncio.to_thread(
+        lambda: split_audio_bytes(read_upload(audio_file), HUME_AUDIO_CHUNK_SECONDS))
+    logger.debug(f"Audio split into {len(chunks)} chunks")
+
+    chunk_predictions = await analyze_audio(client, config, chunks)
+
+    timeline = []
+    all_predictions = []
+    offsets = []
+    for chunk, predictions in zip(chunks, chunk_predictions):
+        entry = {"index": chunk["index"], "start": chunk["start"], "end": chunk["end"]}
+        if predictions is None:
+            entry["error"] = "Analysis failed for this chunk."
+            entry["topEmotions"] = []
+        else:
+            all_predictions.extend(predictions)
+            # Prosody times are relative to the chunk
+            offsets.extend([chunk["start"]] * len(predictions))
+            entry["topEmotions"] = aggregate_predictions(predictions)["topEmotions"]
+        timeline.append(entry)
+
+    results = aggregate_audio_results(all_predictions, detailed=detailed)
+    results["chunks"] = timeline
+    if timeline_windows and all_predictions:
+        results["timeline"] = emotion_timeline(all_predictions, timeline_windows, offsets=offsets)
+    return results
+
+async def process_video(video_file, detailed=False, timeline_windows=None):
+    client = get_hume_client()
+    config = FaceConfig()
 
-async def analyze_audio(client, config, audio_file_path):
-    async with client.connect([config]) as socket:
-        result = await socket.send_file(audio_file_path)
-        return result["prosody"]["predictions"][0]["emotions"] if "prosody" in result else None
+    # Base64-encoding a multi-MB video would stall every other coroutine on the loop
+    video_data = await asyncio.to_thread(read_upload_base64, video_file)
+    result = await analyze_video(client, config, video_data)
+    results = aggregate_video_results(result, detailed=detailed)
+    if timeline_windows and result:
+        results["timeline"] = emotion_timeline(result, timeline_windows)
+    return results
+
+async def analyze_audio(client, config, chunks, concurrency=None):
+    # Fans chunks out over a bounded number of sockets. Returns one entry per chunk,
+    # in chunk order: the list of prosody predictions, or None if the chunk failed.
+    concurrency = concurrency or HUME_AUDIO_CHUNK_CONCURRENCY
+    retry.breakers['hume'].before_call()
+    results = [None] * len(chunks)
+    pending = deque(range(len(chunks)))
+    attempts = [0] * len(chunks)
+
+    async def worker():
+        reconnects = 0
+        while pending and reconnects <= 2:
+            index = None
+            try:
+                async with client.connect([config]) as socket:
+                    while pending:
+                        index = pending.popleft()
+                        attempts[index] += 1
+                        results[index] = await analyze_audio_chunk(socket, chunks[index])
+                        index = None
+            except Exception as e:
+                # Socket state is unknown after a failure, reconnect for the remaining chunks
+                logger.warning(f"Audio chunk analysis failed: {str(e)}")
+                if retry.classify_error(e).provider_failure:
+                    retry.breakers['hume'].record_failure()
+                # The chunk in flight goes back first, unless it keeps failing on its own
+                if index is not None and attempts[index] < 3:
+                    pending.appendleft(index)
+                reconnects += 1
+
+    await asyncio.gather(*[worker() for _ in range(min(concurrency, len(chunks)))])
+    return results
+
+async def analyze_audio_chunk(socket, chunk):
+    result = await socket.send_bytes(base64.b64encode(chunk["data"]))
+    if "prosody" not in result:
+        logger.warning(f"Unexpected API response format for audio chunk {chunk['index']}: {result}")
+        return None
+    # No speech in a chunk is a warning, not a failure
+    return result["prosody"].get("predictions", [])
 
-async def analyze_video(client, config, video_file_path):
+@with_retries('hume')
+async def analyze_video(client, config, video_base64):
     async with client.connect([config]) as socket:
-        result = await socket.send_file(video_file_path)
+        result = await socket.send_bytes(video_base64)
         return result["face"]["predictions"] if "face" in result else None
 
-def aggregate_audio_results(results):
-    if not results:
+def aggregate_audio_results(predictions, detailed=False):
+    if not predictions:
         return {"error": "No valid results to aggregate."}
-    
-    all_emotions = {}
-    for emotion in results:
-        name = emotion['name']
-        score = emotion['score']
-        all_emotions[name] = all_emotions.get(name, []) + [score]
-    
-    avg_emotions = {name: np.mean(scores) for name, scores in all_emotions.items()}
-    sorted_emotions = sorted(avg_emotions.items(), key=lambda x: x[1], reverse=True)
-    
-    return {"topEmotions": sorted_emotions[:5]}
+    return aggregate_predictions(predictions, detailed=detailed)
 
-def aggregate_video_results(results):
-    if not results:
+def aggregate_video_results(predictions, detailed=False):
+    if not predictions:
         return {"error": "No valid video results to aggregate."}
-    
-    all_emotions = {}
-    for frame in results:
-        if 'emotions' in frame:
-            for emotion in frame['emotions']:
-                name = emotion['name']
-                score = emotion['score']
-                all_emotions[name] = all_emotions.get(name, []) + [score]
-    
-    avg_emotions = {name: np.mean(scores) for name, scores in all_emotions.items()}
-    sorted_emotions = sorted(avg_emotions.items(), key=lambda x: x[1], reverse=True)
-    
-    return {"topEmotions": sorted_emotions[:5]}
+    return aggregate_predictions(predictions, detailed=detailed)
 
-@retry_with_backoff(retries=3)
-def generate_feedback_openai(api_key, analysis_results):
-    client = OpenAI(api_key=api_key)
+@with_retries('openai')
+async def generate_feedback_openai(api_key, analysis_results):
+    client = llm_clients.async_openai_client(api_key)
     try:
-        chat_completion = client.chat.completions.create(
-            model="gpt-3.5-turbo-0125",
+        chat_completion = await client.chat.completions.create(
+            model=OPENAI_MODEL,
             messages=[
                 {"role": "system", "content": "You must be an expert career coach providing feedback on a practice pitch concisely, smartly and efficiently based on the pitch analysis scores. You must reply as if you are directly talking to the user"},
                 {"role": "user", "content": f" Pitch analysis: {analysis_results}"}
             ]
         )
         return chat_completion.choices[0].message.content
-    except Exception as e:
+    except Exception:
         logger.exception("Error generating feedback with OpenAI")
-        raise  # Re-raise the exception to trigger the retry
+        raise  # Re-raise so the retry policy can classify it
 
-@retry_with_backoff(retries=3)
-def generate_feedback_hf(api_key, model_name, analysis_results):
-    client = InferenceClient(
-        model=model_name,
-        token=api_key,
-    )
+@with_retries('hf')
+async def generate_feedback_hf(api_key, model_name, analysis_results):
+    client = llm_clients.async_hf_client(api_key, model_name)
     try:
-        response = client.chat_completion(
+        response = await client.chat_completion(
             messages=[
                 {"role": "system", "content": "You must be an expert career coach providing feedback on a practice pitch concisely, smartly and efficiently based on the pitch analysis scores. You must reply as if you are directly talking to the user"},
                 {"role": "user", "content": f" Pitch analysis: {analysis_results}"}
@@ -561,14 +1547,17 @@ def generate_feedback_hf(api_key, model_name, analysis_results):
             stream=False,
         )
         return response.choices[0].message.content
-    except Exception as e:
+    except Exception:
         logger.exception("Error generating feedback with Hugging Face")
-        raise  # Re-raise the exception to trigger the retry
+        raise  # Re-raise so the retry policy can classify it
 
 @app.route('/generate-feedback', methods=['POST'])
 def generate_feedback():
+    body, status = event_loop.run(handle_generate_feedback(request.json))
+    return jsonify(body), status
+
+async def handle_generate_feedback(data):
     try:
-        data = request.json
         analysis_results = data.get('analysisResults')
         is_trial_mode = data.get('isTrialMode') == 'true'
         api_type = data.get('apiType', 'openai')
@@ -577,30 +1566,31 @@ def generate_feedback():
         model_name = data.get('modelName', 'meta-llama/Meta-Llama-3-8B-Instruct')
 
         if not user_id:
-            return jsonify({"error": "User ID is required"}), 400
+            return {"error": "User ID is required"}, 400
 
         if is_trial_mode:
             if user_trials[user_id] <= 0:
-                return jsonify({"error": "Free trials are exhausted. Please provide your own API key."}), 403
+                return {"error": "Free trials are exhausted. Please provide your own API key."}, 403
             api_key = OPENAI_API_KEY
             api_type = 'openai'
         else:
             api_key = user_api_key
 
-        if api_type == 'openai':
-            feedback = generate_feedback_openai(api_key, analysis_results)
-        elif api_type == 'hf':
-            feedback = generate_feedback_hf(api_key, model_name, analysis_results)
-        else:
-            return jsonify({"error": "Invalid API type"}), 400
+        with retry.deadline(LLM_REQUEST_DEADLINE):
+            if api_type == 'openai':
+                feedback = await generate_feedback_openai(api_key, analysis_results)
+            elif api_type == 'hf':
+                feedback = await generate_feedback_hf(api_key, model_name, analysis_results)
+            else:
+                return {"error": "Invalid API type"}, 400
 
         if not feedback:
-            return jsonify({"error": "Failed to generate feedback"}), 500
+            return {"error": "Failed to generate feedback"}, 500
 
-        return jsonify({"feedback": feedback})
+        return {"feedback": feedback}, 200
     except Exception as e:
         logger.exception("Error in generate_feedback")
-        return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
+        return {"error": f"An unexpected error occurred: {str(e)}"}, 500
     
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,326 @@
+# Async serving mode:
+#   gunicorn asgi:application -k uvicorn.workers.UvicornWorker
+#
+# The I/O-bound routes, the server-sent event streams and CORS preflights are served
+# natively on the worker's event loop, so one process can hold hundreds of in-flight
+# OpenAI / Hugging Face / Hume calls. Every other route falls through to the Flask
+# app, run in a thread pool.
+
+import asyncio
+import concurrent.futures
+import contextlib
+import io
+import json
+import logging
+import os
+import tempfile
+import traceback
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+import app as careerbuddy
+from uploads import SpooledUploadRequest, UPLOAD_SPILL_LIMIT
+
+logger = logging.getLogger(__name__)
+
+# Threads for the Flask fallback and for the sync SSE generator of the pitch stream;
+# each open stream holds one
+ASGI_THREADS = int(os.getenv('ASGI_THREADS', 32))
+executor = concurrent.futures.ThreadPoolExecutor(max_workers=ASGI_THREADS, thread_name_prefix='careerbuddy-wsgi')
+
+
+class ThreadPoolWsgiToAsgiInstance(WsgiToAsgiInstance):
+    # asgiref runs every WSGI call on one shared thread (thread_sensitive=True), which
+    # would queue each fallback request behind any long response still streaming
+    run_wsgi_app = sync_to_async(WsgiToAsgiInstance.__dict__['run_wsgi_app'].func, thread_sensitive=False, executor=executor)
+
+
+class ThreadPoolWsgiToAsgi(WsgiToAsgi):
+    async def __call__(self, scope, receive, send):
+        await ThreadPoolWsgiToAsgiInstance(self.wsgi_application, self.duplicate_header_limit)(scope, receive, send)
+
+
+wsgi_fallback = ThreadPoolWsgiToAsgi(careerbuddy.app)
+
+# Audio is only served natively, from the worker's loop (warmed at lifespan startup).
+# Sessions warmed on event_loop's loop by Flask fallback requests would never be used,
+# and each one is an open, billed EVI chat.
+careerbuddy.EVI_POOL_WARM_ON_REQUEST = False
+
+ALLOWED_ORIGINS = {origin.rstrip('/') for origin in careerbuddy.CORS_ORIGINS}
+
+
+async def validate_api_key(req):
+    return await careerbuddy.handle_validate_api_key(req.get_json())
+
+
+async def generate_pitches(req):
+    data = careerbuddy.request_data(req)
+    if data is None:
+        return {"error": "Unsupported Media Type"}, 415
+
+    # PDF extraction is CPU-bound, keep it off the event loop
+    params, error = await asyncio.to_thread(careerbuddy.parse_pitch_request, data, req.files)
+    if error:
+        return error
+    return await careerbuddy.handle_generate_pitches(params)
+
+
+async def generate_audio(req):
+    mimetype = careerbuddy.negotiate_audio_format(req)
+    if mimetype is None:
+        return {"error": "Unsupported audio format"}, 406
+    return await careerbuddy.handle_generate_audio(req.get_json(), mimetype, req.if_none_match)
+
+
+class EventStream:
+    """Handler result for a text/event-stream response: an async iterator of SSE strings."""
+
+    def __init__(self, events):
+        self.events = events
+
+
+async def iterate_in_thread(gen):
+    # Drives a blocking sync generator from the event loop, one item per executor call.
+    # If the stream is abandoned mid-item, the generator is closed once that item is ready.
+    loop = asyncio.get_running_loop()
+    end = object()
+    pending = None
+    try:
+        while True:
+            pending = loop.run_in_executor(executor, next, gen, end)
+            item = await pending
+            if item is end:
+                return
+            yield item
+    finally:
+        if pending is not None and not pending.done():
+            pending.add_done_callback(lambda _: executor.submit(gen.close))
+        else:
+            await loop.run_in_executor(executor, gen.close)
+
+
+async def generate_pitches_stream(req):
+    data = careerbuddy.request_data(req)
+    if data is None:
+        return {"error": "Unsupported Media Type"}, 415
+
+    params, error = await asyncio.to_thread(careerbuddy.parse_pitch_request, data, req.files)
+    if error:
+        return error
+    return EventStream(iterate_in_thread(careerbuddy.stream_pitch_events(params))), 200
+
+
+async def generate_pitches_batch(req):
+    data = careerbuddy.request_data(req)
+    if data is None:
+        return {"error": "Unsupported Media Type"}, 415
+
+    params, error = await asyncio.to_thread(careerbuddy.parse_batch_request, data, req.files)
+    if error:
+        return error
+    return EventStream(careerbuddy.stream_batch_events(params)), 200
+
+
+async def generate_audio_stream(req):
+    pitch_text = (req.get_json(silent=True) or {}).get('pitchText')
+    if not pitch_text:
+        return {"error": "No pitch text provided"}, 400
+    return EventStream(careerbuddy.stream_audio(pitch_text)), 200
+
+
+async def analyze_practice(req):
+    return await careerbuddy.handle_analyze_practice(req.files, req.form)
+
+
+async def generate_feedback(req):
+    return await careerbuddy.handle_generate_feedback(req.get_json())
+
+
+ASYNC_ROUTES = {
+    ('POST', '/validate-api-key'): validate_api_key,
+    ('POST', '/generate-pitches'): generate_pitches,
+    ('POST', '/generate-pitches/stream'): generate_pitches_stream,
+    ('POST', '/generate-pitches/batch'): generate_pitches_batch,
+    ('POST', '/generate-audio'): generate_audio,
+    ('POST', '/generate-audio/stream'): generate_audio_stream,
+    ('POST', '/analyze-practice'): analyze_practice,
+    ('POST', '/generate-feedback'): generate_feedback,
+}
+
+
+async def read_body(receive):
+    # Large request bodies spill to an anonymous temp file, same limit as under Flask
+    body = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPILL_LIMIT, mode="w+b")
+    while True:
+        message = await receive()
+        body.write(message.get('body', b''))
+        if not message.get('more_body'):
+            length = body.tell()
+            body.seek(0)
+            return body, length
+
+
+def build_request(scope, body, length):
+    # Werkzeug parses form, multipart and JSON bodies from a WSGI environ,
+    # so the handlers see the same request objects as under Flask
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'SERVER_NAME': (scope.get('server') or ('localhost', 80))[0],
+        'SERVER_PORT': str((scope.get('server') or ('localhost', 80))[1]),
+        'CONTENT_LENGTH': str(length),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': io.StringIO(),
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'CONTENT_LENGTH':
+            environ[f'HTTP_{name}'] = value
+    return SpooledUploadRequest(environ)
+
+
+def cors_headers(req):
+    origin = req.headers.get('Origin', '')
+    if origin.rstrip('/') in ALLOWED_ORIGINS:
+        return [
+            (b'access-control-allow-origin', origin.encode('latin-1')),
+            (b'access-control-expose-headers', ', '.join(careerbuddy.AUDIO_EXPOSED_HEADERS).encode('latin-1')),
+            (b'vary', b'Origin'),
+        ]
+    return []
+
+
+# Same as the flask_cors defaults: any method, and whatever headers the browser asks for
+PREFLIGHT_METHODS = b'DELETE, GET, HEAD, OPTIONS, PATCH, POST, PUT'
+
+
+def preflight_headers(scope):
+    headers = {name.decode('latin-1').lower(): value for name, value in scope.get('headers', [])}
+    origin = headers.get('origin', b'').decode('latin-1')
+    if origin.rstrip('/') not in ALLOWED_ORIGINS:
+        return []
+    response_headers = [
+        (b'access-control-allow-origin', origin.encode('latin-1')),
+        (b'access-control-allow-methods', PREFLIGHT_METHODS),
+        (b'vary', b'Origin'),
+    ]
+    if headers.get('access-control-request-headers'):
+        response_headers.append((b'access-control-allow-headers', headers['access-control-request-headers']))
+    return response_headers
+
+
+async def send_preflight(scope, send):
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-length', b'0')] + preflight_headers(scope),
+    })
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def send_event_stream(receive, send, events, extra_headers):
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ] + extra_headers,
+    })
+
+    async def disconnected():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    # A client that goes away stops the stream (and closes the generator) right away,
+    # not at the next event
+    watcher = asyncio.ensure_future(disconnected())
+    try:
+        while True:
+            next_event = asyncio.ensure_future(events.__anext__())
+            await asyncio.wait({next_event, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if not next_event.done():
+                next_event.cancel()
+                with contextlib.suppress(asyncio.CancelledError, StopAsyncIteration):
+                    await next_event
+                return
+            try:
+                event = next_event.result()
+            except StopAsyncIteration:
+                break
+            await send({'type': 'http.response.body', 'body': event.encode('utf-8'), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        watcher.cancel()
+        await events.aclose()
+
+
+async def send_response(send, body, status, extra_headers):
+    if isinstance(body, careerbuddy.RawResponse):
+        payload = body.content
+        content_type = body.mimetype
+        extra_headers = extra_headers + [
+            (name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in body.headers.items()
+        ]
+    else:
+        payload = json.dumps(body).encode('utf-8')
+        content_type = 'application/json'
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', content_type.encode('latin-1')),
+            (b'content-length', str(len(payload)).encode('latin-1')),
+        ] + extra_headers,
+    })
+    await send({'type': 'http.response.body', 'body': payload})
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                # Native audio routes run on this loop, which gets its own warm EVI sessions
+                await careerbuddy.evi_pool.start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await careerbuddy.evi_pool.close()
+                await careerbuddy.llm_clients.close_sessions()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    if scope['type'] == 'http' and scope.get('method') == 'OPTIONS':
+        return await send_preflight(scope, send)
+
+    handler = ASYNC_ROUTES.get((scope.get('method'), scope.get('path'))) if scope['type'] == 'http' else None
+    if handler is None:
+        return await wsgi_fallback(scope, receive, send)
+
+    body, length = await read_body(receive)
+    req = build_request(scope, body, length)
+    try:
+        response_body, status = await handler(req)
+    except Exception as e:
+        print(f"Unexpected error: {str(e)}")
+        print(traceback.format_exc())
+        response_body, status = {"error": f"An unexpected error occurred: {str(e)}"}, 500
+    finally:
+        req.close()
+        body.close()
+    if isinstance(response_body, EventStream):
+        return await send_event_stream(receive, send, response_body.events, cors_headers(req))
+    await send_response(send, response_body, status, cors_headers(req))
@@ -0,0 +1,151 @@
+# In-memory audio chunk handling: splitting practice recordings into short WAV
+# chunks for the Hume prosody stream API, which only accepts a few seconds of audio
+# per payload, and joining the WAV chunks EVI streams back into one file.
+
+import io
+import logging
+import struct
+import wave
+
+from pydub import AudioSegment
+
+logger = logging.getLogger(__name__)
+
+
+def split_wav_bytes(data, chunk_seconds):
+    chunks = []
+    with wave.open(io.BytesIO(data), 'rb') as wf:
+        n_channels = wf.getnchannels()
+        sampwidth = wf.getsampwidth()
+        framerate = wf.getframerate()
+        n_frames = wf.getnframes()
+
+        chunk_size = max(1, int(chunk_seconds * framerate))
+        for index, start in enumerate(range(0, n_frames, chunk_size)):
+            end = min(start + chunk_size, n_frames)
+            buffer = io.BytesIO()
+            with wave.open(buffer, 'wb') as chunk_wf:
+                chunk_wf.setnchannels(n_channels)
+                chunk_wf.setsampwidth(sampwidth)
+                chunk_wf.setframerate(framerate)
+                chunk_wf.writeframes(wf.readframes(end - start))
+            chunks.append({
+                "index": index,
+                "start": start / framerate,
+                "end": end / framerate,
+                "data": buffer.getvalue(),
+            })
+    return chunks
+
+
+def split_encoded_audio(data, chunk_seconds):
+    # Browsers often upload webm/ogg even when the blob is labelled audio/wav
+    segment = AudioSegment.from_file(io.BytesIO(data))
+    chunk_ms = int(chunk_seconds * 1000)
+    chunks = []
+    for index, start_ms in enumerate(range(0, len(segment), chunk_ms)):
+        end_ms = min(start_ms + chunk_ms, len(segment))
+        buffer = io.BytesIO()
+        segment[start_ms:end_ms].export(buffer, format="wav")
+        chunks.append({
+            "index": index,
+            "start": start_ms / 1000,
+            "end": end_ms / 1000,
+            "data": buffer.getvalue(),
+        })
+    return chunks
+
+
+def split_audio_bytes(data, chunk_seconds):
+    if data[:4] == b'RIFF' and data[8:12] == b'WAVE':
+        try:
+            return split_wav_bytes(data, chunk_seconds)
+        except (wave.Error, EOFError) as e:
+            logger.warning(f"Could not parse WAV upload, decoding with ffmpeg instead: {str(e)}")
+    try:
+        return split_encoded_audio(data, chunk_seconds)
+    except Exception as e:
+        # Fall back to sending the recording as a single payload
+        logger.warning(f"Could not decode audio for chunking: {str(e)}")
+        return [{"index": 0, "start": 0.0, "end": None, "data": data}]
+
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+def parse_wav(data):
+    # Returns ((channels, sample_width, frame_rate), pcm memoryview) without copying the
+    # samples. Streaming encoders often leave the RIFF/data sizes at 0 or 0xFFFFFFFF,
+    # so a data chunk is taken to run at most to the end of the buffer.
+    view = memoryview(data)
+    if len(data) < 12 or data[:4] != b'RIFF' or data[8:12] != b'WAVE':
+        raise ValueError("Not a RIFF/WAVE chunk")
+    params = None
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id = bytes(view[offset:offset + 4])
+        (size,) = struct.unpack_from('<I', data, offset + 4)
+        body = offset + 8
+        if chunk_id == b'fmt ':
+            tag, channels, frame_rate, _, _, bits = struct.unpack_from('<HHIIHH', data, body)
+            if tag not in (WAVE_FORMAT_PCM, WAVE_FORMAT_EXTENSIBLE):
+                raise ValueError(f"Unsupported WAV format tag {tag}")
+            params = (channels, bits // 8, frame_rate)
+        elif chunk_id == b'data':
+            if params is None:
+                raise ValueError("WAV data chunk before fmt chunk")
+            end = len(data) if size in (0, 0xFFFFFFFF) else min(len(data), body + size)
+            block = params[0] * params[1]
+            return params, view[body:end - (end - body) % block]
+        offset = body + size + (size & 1)
+    raise ValueError("WAV chunk has no data")
+
+
+def wav_header(params, data_size):
+    channels, sample_width, frame_rate = params
+    return struct.pack(
+        '<4sI4s4sIHHIIHH4sI',
+        b'RIFF', 36 + data_size, b'WAVE',
+        b'fmt ', 16, WAVE_FORMAT_PCM, channels, frame_rate,
+        frame_rate * channels * sample_width, channels * sample_width, sample_width * 8,
+        b'data', data_size,
+    )
+
+
+def convert_pcm(pcm, params, target):
+    # Resamples / remixes a chunk whose format differs from the first one's
+    channels, sample_width, frame_rate = params
+    segment = AudioSegment(data=bytes(pcm), sample_width=sample_width, frame_rate=frame_rate, channels=channels)
+    segment = segment.set_frame_rate(target[2]).set_channels(target[0]).set_sample_width(target[1])
+    return memoryview(segment.raw_data)
+
+
+def concat_wav_chunks(chunks):
+    # Joins WAV chunks into one WAV: headers are parsed once, the PCM frames are copied
+    # once into a buffer preallocated for the whole file, and one header is written.
+    # The first chunk's format wins; mismatched chunks are converted to it.
+    # Returns a bytearray, or None for no chunks. Raises ValueError for non-PCM input.
+    try:
+        parsed = [parse_wav(chunk) for chunk in chunks]
+    except struct.error as e:
+        raise ValueError(f"Truncated WAV chunk: {str(e)}")
+    if not parsed:
+        return None
+    target = parsed[0][0]
+    frames = []
+    for params, pcm in parsed:
+        if params != target:
+            logger.warning(f"Converting EVI audio chunk from {params} to {target}")
+            pcm = convert_pcm(pcm, params, target)
+        frames.append(pcm)
+
+    data_size = sum(len(pcm) for pcm in frames)
+    header = wav_header(target, data_size)
+    buffer = bytearray(len(header) + data_size)
+    buffer[:len(header)] = header
+    offset = len(header)
+    for pcm in frames:
+        buffer[offset:offset + len(pcm)] = pcm
+        offset += len(pcm)
+    return buffer
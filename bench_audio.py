@@ -0,0 +1,71 @@
+# Benchmark: assembling EVI audio_output chunks into one WAV for a 60-second pitch.
+# Compares the previous pydub decode / += / export path with audio_chunks.concat_wav_chunks
+# on CPU time and peak Python memory (tracemalloc).
+#
+#   python bench_audio.py
+
+import io
+import time
+import tracemalloc
+import wave
+
+import numpy as np
+from pydub import AudioSegment
+
+from audio_chunks import concat_wav_chunks, parse_wav
+
+
+def legacy_concat(chunks):
+    # The implementation receive_audio used before concat_wav_chunks
+    combined_audio = AudioSegment.empty()
+    for chunk in chunks:
+        segment = AudioSegment.from_wav(io.BytesIO(chunk))
+        combined_audio += segment
+    return combined_audio.export(format="wav").read()
+
+
+def make_chunks(seconds, chunk_seconds, frame_rate=24000, seed=0):
+    # EVI-like output: 16-bit mono PCM WAV chunks of a fraction of a second each
+    rng = np.random.default_rng(seed)
+    chunks = []
+    frames_per_chunk = int(chunk_seconds * frame_rate)
+    for _ in range(int(seconds / chunk_seconds)):
+        samples = rng.integers(-8000, 8000, frames_per_chunk, dtype=np.int16)
+        buffer = io.BytesIO()
+        with wave.open(buffer, 'wb') as wf:
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(frame_rate)
+            wf.writeframes(samples.tobytes())
+        chunks.append(buffer.getvalue())
+    return chunks
+
+
+def measure(func, chunks, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.process_time()
+        result = func(chunks)
+        best = min(best, time.process_time() - start)
+    tracemalloc.start()
+    func(chunks)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, result
+
+
+def main():
+    print(f"{'pitch':>6} {'chunks':>7} {'legacy cpu':>11} {'new cpu':>9} {'legacy peak':>12} {'new peak':>9}")
+    for seconds, chunk_seconds in ((60, 1.0), (60, 0.25), (180, 0.5)):
+        chunks = make_chunks(seconds, chunk_seconds)
+        legacy_cpu, legacy_peak, legacy = measure(legacy_concat, chunks)
+        new_cpu, new_peak, new = measure(concat_wav_chunks, chunks)
+        # Same samples and format as the pydub output
+        assert parse_wav(legacy)[0] == parse_wav(new)[0]
+        assert parse_wav(legacy)[1].tobytes() == parse_wav(new)[1].tobytes()
+        print(f"{seconds:>5}s {len(chunks):>7} {legacy_cpu * 1000:>9.1f}ms {new_cpu * 1000:>7.1f}ms "
+              f"{legacy_peak / 2**20:>10.1f}MB {new_peak / 2**20:>7.1f}MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+# Load benchmark: concurrent /generate-pitches capacity of one worker,
+# sync Flask (gunicorn's default sync worker) vs the async serving mode in asgi.py.
+#
+# The upstream LLM call is replaced by a fixed-latency coroutine so the numbers
+# measure the serving model rather than OpenAI.
+#
+#   python bench_concurrency.py --requests 200 --latency 2.0
+
+import argparse
+import asyncio
+import contextlib
+import io
+import logging
+import time
+
+import httpx
+
+import app as careerbuddy
+import asgi
+
+
+def install_fake_upstream(latency):
+    async def fake_generate_pitches_openai(api_key, resume, job_description):
+        await asyncio.sleep(latency)
+        return ["pitch one", "pitch two", "pitch three"]
+
+    careerbuddy.generate_pitches_openai = fake_generate_pitches_openai
+
+
+def payload(i):
+    # Unique resume per request so the pitch cache never short-circuits the call
+    return {
+        "resume": f"Benchmark resume {i}",
+        "jobDescription": "Benchmark job description",
+        "userId": f"bench-{i}",
+        "apiType": "openai",
+        "apiKey": "sk-bench",
+    }
+
+
+def bench_sync(n_requests, budget):
+    # A sync worker handles one request at a time; count what fits in the time budget
+    client = careerbuddy.app.test_client()
+    start = time.perf_counter()
+    completed = 0
+    while completed < n_requests and time.perf_counter() - start < budget:
+        response = client.post('/generate-pitches', json=payload(completed))
+        assert response.status_code == 200, response.json
+        completed += 1
+    return completed, time.perf_counter() - start
+
+
+async def bench_async(n_requests):
+    transport = httpx.ASGITransport(app=asgi.application)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        start = time.perf_counter()
+        responses = await asyncio.gather(*[
+            client.post('/generate-pitches', json=payload(10_000 + i)) for i in range(n_requests)
+        ])
+        elapsed = time.perf_counter() - start
+    assert all(r.status_code == 200 for r in responses)
+    return len(responses), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=2.0, help="simulated upstream seconds per call")
+    args = parser.parse_args()
+
+    install_fake_upstream(args.latency)
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    # Silence the app's per-request prints
+    with contextlib.redirect_stdout(io.StringIO()):
+        async_done, async_elapsed = asyncio.run(bench_async(args.requests))
+        sync_done, sync_elapsed = bench_sync(args.requests, async_elapsed)
+
+    print(f"Simulated upstream latency: {args.latency:.2f}s, {args.requests} requests")
+    print(f"sync Flask worker : {sync_done:4d} requests in {sync_elapsed:6.2f}s "
+          f"({sync_done / sync_elapsed:7.2f} req/s, 1 in flight)")
+    print(f"async ASGI worker : {async_done:4d} requests in {async_elapsed:6.2f}s "
+          f"({async_done / async_elapsed:7.2f} req/s, {args.requests} in flight)")
+
+
+if __name__ == '__main__':
+    main()
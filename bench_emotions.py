@@ -0,0 +1,72 @@
+# Microbenchmark: emotion aggregation at realistic Hume frame counts.
+# Compares the previous dict-of-lists aggregation with emotions.aggregate_predictions.
+#
+#   python bench_emotions.py
+
+import random
+import time
+
+import numpy as np
+
+from emotions import EMOTION_NAMES, aggregate_predictions
+
+
+def legacy_aggregate(results):
+    # The implementation aggregate_video_results used before emotions.py
+    all_emotions = {}
+    for frame in results:
+        if 'emotions' in frame:
+            for emotion in frame['emotions']:
+                name = emotion['name']
+                score = emotion['score']
+                all_emotions[name] = all_emotions.get(name, []) + [score]
+
+    avg_emotions = {name: np.mean(scores) for name, scores in all_emotions.items()}
+    sorted_emotions = sorted(avg_emotions.items(), key=lambda x: x[1], reverse=True)
+
+    return {"topEmotions": sorted_emotions[:5]}
+
+
+def make_predictions(n_frames, seed=0):
+    rng = random.Random(seed)
+    return [
+        {"frame": i, "emotions": [{"name": name, "score": rng.random()} for name in EMOTION_NAMES]}
+        for i in range(n_frames)
+    ]
+
+
+def best_of(func, arg, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(arg)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+# The legacy path is quadratic in frame count; above this it takes minutes
+LEGACY_MAX_FRAMES = 10000
+
+
+def main():
+    print(f"{'frames':>8} {'legacy':>10} {'vectorized':>11} {'+stats':>9} {'speedup':>8}")
+    # ~2 min of video at 30 fps is 3600 frames; long sessions reach tens of thousands
+    for n_frames in (600, 3600, 10000, 60000):
+        predictions = make_predictions(n_frames)
+        new_time, new = best_of(aggregate_predictions, predictions, 3)
+        stats_time, _ = best_of(lambda p: aggregate_predictions(p, detailed=True), predictions, 3)
+
+        if n_frames <= LEGACY_MAX_FRAMES:
+            legacy_time, legacy = best_of(legacy_aggregate, predictions, 1)
+            assert [name for name, _ in legacy["topEmotions"]] == [name for name, _ in new["topEmotions"]]
+            assert np.allclose([s for _, s in legacy["topEmotions"]], [s for _, s in new["topEmotions"]])
+            legacy_col = f"{legacy_time * 1000:>8.1f}ms"
+            speedup_col = f"{legacy_time / new_time:>7.1f}x"
+        else:
+            legacy_col, speedup_col = f"{'skipped':>10}", f"{'-':>8}"
+
+        print(f"{n_frames:>8} {legacy_col} {new_time * 1000:>9.1f}ms {stats_time * 1000:>7.1f}ms {speedup_col}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+# Benchmark: PDF text extraction on the sample documents and synthetic long PDFs
+# (the sample resume page repeated). Compares the previous PyPDF2 loop with
+# pdf_text.extract_text per backend, with the default text cutoff and without one.
+#
+#   python bench_pdf.py
+
+import io
+import time
+
+import PyPDF2
+
+import pdf_text
+
+
+def legacy_extract(data):
+    # The implementation extract_text_from_pdf used before pdf_text.py
+    pdf_reader = PyPDF2.PdfReader(io.BytesIO(data))
+    text = ""
+    for page in pdf_reader.pages:
+        text += page.extract_text()
+    return text
+
+
+def synthetic_pdf(source, n_pages):
+    reader = PyPDF2.PdfReader(io.BytesIO(source))
+    writer = PyPDF2.PdfWriter()
+    for i in range(n_pages):
+        writer.add_page(reader.pages[i % len(reader.pages)])
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def best_of(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    with open("test_resume.pdf", "rb") as f:
+        resume = f.read()
+    with open("test_jd.pdf", "rb") as f:
+        jd = f.read()
+
+    documents = [("test_resume.pdf", resume), ("test_jd.pdf", jd)]
+    documents += [(f"synthetic {n} pages", synthetic_pdf(resume, n)) for n in (20, 100, 300)]
+
+    backends = ["pypdf2"] + (["pdfium"] if pdf_text.pdfium is not None else [])
+    # Start the process pool outside the timings; it is reused across requests
+    pdf_text.get_pool().submit(int).result()
+    unlimited = 10 ** 9
+
+    columns = ["legacy"] + [f"{b}" for b in backends] + [f"{b} full" for b in backends]
+    print(f"{'document':<22}" + "".join(f"{c:>14}" for c in columns))
+    for name, data in documents:
+        timings = [best_of(lambda: legacy_extract(data), 3)]
+        timings += [best_of(lambda: pdf_text.extract_text(data, backend=b), 3) for b in backends]
+        # "full": every page, no text cutoff (page limit lifted too)
+        timings += [
+            best_of(lambda: pdf_text.extract_text(data, max_pages=unlimited, max_chars=unlimited, backend=b), 3)
+            for b in backends
+        ]
+        print(f"{name:<22}" + "".join(f"{t * 1000:>12.1f}ms" for t in timings))
+
+
+if __name__ == '__main__':
+    main()
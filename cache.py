@@ -0,0 +1,208 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def hash_key(*parts):
+    # Stable content hash over any JSON-serialisable parts
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def normalize_text(text):
+    # Whitespace-insensitive form used for cache keys
+    return " ".join((text or "").split())
+
+
+class MemoryCache:
+    """In-process TTL + LRU cache. Hits are only shared within one worker."""
+
+    backend = "memory"
+
+    def __init__(self, name, max_entries=256, ttl=3600):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.time():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "name": self.name,
+            "backend": self.backend,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / total, 4) if total else 0.0,
+            "size": len(self),
+        }
+
+
+class DiskCache(MemoryCache):
+    """SQLite-backed TTL + LRU cache shared by every worker pointing at the same directory.
+
+    Values are stored as JSON, or as raw BLOBs when they are bytes.
+    """
+
+    backend = "disk"
+
+    def __init__(self, name, directory, max_entries=10000, ttl=3600, max_bytes=None):
+        super().__init__(name, max_entries=max_entries, ttl=ttl)
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{name}.sqlite3")
+        self._conn = None
+        self._pid = None
+        with self._lock:
+            self._connect()
+
+    def _connect(self):
+        # Connections must not be shared across a fork, so reopen per process
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value BLOB, is_bytes INTEGER, size INTEGER, "
+                "expires_at REAL, last_access REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries(last_access)")
+            self._pid = os.getpid()
+        return self._conn
+
+    def get(self, key):
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connect()
+                row = conn.execute(
+                    "SELECT value, is_bytes, expires_at FROM entries WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and (row[2] is None or row[2] > now):
+                    conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+                    self.hits += 1
+                    return bytes(row[0]) if row[1] else json.loads(row[0])
+                if row is not None:
+                    conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+        except sqlite3.Error as e:
+            logger.warning(f"{self.name} cache read failed: {str(e)}")
+            self.misses += 1
+            return None
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        is_bytes = isinstance(value, (bytes, bytearray))
+        stored = bytes(value) if is_bytes else json.dumps(value)
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, is_bytes, size, expires_at, last_access) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, stored, int(is_bytes), len(stored), expires_at, now),
+                )
+                self._evict(conn, now)
+        except sqlite3.Error as e:
+            logger.warning(f"{self.name} cache write failed: {str(e)}")
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM entries WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+        count, total_size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        if count > self.max_entries:
+            conn.execute(
+                "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY last_access ASC LIMIT ?)",
+                (count - self.max_entries,),
+            )
+        if self.max_bytes and total_size > self.max_bytes:
+            excess = total_size - self.max_bytes
+            freed = 0
+            victims = []
+            for key, size in conn.execute("SELECT key, size FROM entries ORDER BY last_access ASC"):
+                if freed >= excess:
+                    break
+                victims.append((key,))
+                freed += size
+            conn.executemany("DELETE FROM entries WHERE key = ?", victims)
+
+    def delete(self, key):
+        with self._lock:
+            self._connect().execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._lock:
+            self._connect().execute("DELETE FROM entries")
+
+    def __len__(self):
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+
+def make_cache(name, backend="memory", directory=None, max_entries=256, ttl=3600, max_bytes=None):
+    if backend == "disk":
+        directory = directory or os.path.join(os.getcwd(), ".cache")
+        try:
+            return DiskCache(name, directory, max_entries=max_entries, ttl=ttl, max_bytes=max_bytes)
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"Falling back to in-memory {name} cache: {str(e)}")
+    return MemoryCache(name, max_entries=max_entries, ttl=ttl)
+
+
+# Every cache created by the app registers here so hit/miss counters can be exposed
+registry = {}
+
+
+def register(cache):
+    registry[cache.name] = cache
+    return cache
+
+
+def all_stats():
+    return {name: cache.stats() for name, cache in registry.items()}
@@ -0,0 +1,148 @@
+# Vectorized aggregation of Hume expression predictions (prosody and face).
+# Predictions are packed into a (frames x emotions) matrix with a fixed column
+# per emotion name, then every statistic is computed in one pass over it.
+
+import base64
+
+import numpy as np
+
+# Hume's 48 expression emotions, shared by the prosody and face models
+EMOTION_NAMES = [
+    "Admiration", "Adoration", "Aesthetic Appreciation", "Amusement", "Anger", "Anxiety",
+    "Awe", "Awkwardness", "Boredom", "Calmness", "Concentration", "Confusion",
+    "Contemplation", "Contempt", "Contentment", "Craving", "Desire", "Determination",
+    "Disappointment", "Disgust", "Distress", "Doubt", "Ecstasy", "Embarrassment",
+    "Empathic Pain", "Entrancement", "Envy", "Excitement", "Fear", "Guilt",
+    "Horror", "Interest", "Joy", "Love", "Nostalgia", "Pain",
+    "Pride", "Realization", "Relief", "Romance", "Sadness", "Satisfaction",
+    "Shame", "Surprise (negative)", "Surprise (positive)", "Sympathy", "Tiredness", "Triumph",
+]
+
+PERCENTILES = (50, 90)
+
+
+class EmotionIndex:
+    """Maps emotion names to matrix columns; names Hume adds later get new columns."""
+
+    def __init__(self, names=EMOTION_NAMES):
+        self.names = list(names)
+        self.columns = {name: i for i, name in enumerate(self.names)}
+
+    def column(self, name):
+        if name not in self.columns:
+            self.columns[name] = len(self.names)
+            self.names.append(name)
+        return self.columns[name]
+
+
+def pack_predictions(predictions, index=None):
+    # predictions: [{"emotions": [{"name", "score"}, ...]}, ...] -> (matrix, names)
+    # Emotions missing from a frame are NaN so they don't drag averages down.
+    index = index or EmotionIndex()
+    frames = [p["emotions"] for p in predictions if p and p.get("emotions")]
+    if not frames:
+        return np.empty((0, len(index.names))), index.names
+
+    # Hume returns every emotion in the same order for every frame, so the
+    # column mapping is resolved once and rows are filled in bulk
+    order = [e["name"] for e in frames[0]]
+    if all([e["name"] for e in f] == order for f in frames):
+        columns = np.array([index.column(name) for name in order])
+        scores = np.array([[e["score"] for e in f] for f in frames], dtype=np.float64)
+        matrix = np.full((len(frames), len(index.names)), np.nan)
+        matrix[:, columns] = scores
+        return matrix, index.names
+
+    rows, cols, values = [], [], []
+    for row, frame in enumerate(frames):
+        for emotion in frame:
+            rows.append(row)
+            cols.append(index.column(emotion["name"]))
+            values.append(emotion["score"])
+    matrix = np.full((len(frames), len(index.names)), np.nan)
+    matrix[rows, cols] = values
+    return matrix, index.names
+
+
+def summarize(matrix, names, top_k=5, detailed=False):
+    present = ~np.all(np.isnan(matrix), axis=0)
+    matrix = matrix[:, present]
+    names = [name for name, keep in zip(names, present) if keep]
+    if matrix.size == 0:
+        return {"topEmotions": []}
+
+    means = np.nanmean(matrix, axis=0)
+    top = np.argsort(-means, kind="stable")[:top_k]
+    summary = {"topEmotions": [(names[i], float(means[i])) for i in top]}
+
+    if detailed:
+        maxes = np.nanmax(matrix, axis=0)
+        stds = np.nanstd(matrix, axis=0)
+        percentiles = np.nanpercentile(matrix, PERCENTILES, axis=0)
+        summary["frames"] = int(matrix.shape[0])
+        summary["stats"] = {
+            name: {
+                "mean": float(means[i]),
+                "max": float(maxes[i]),
+                "std": float(stds[i]),
+                **{f"p{p}": float(percentiles[j, i]) for j, p in enumerate(PERCENTILES)},
+            }
+            for i, name in enumerate(names)
+        }
+    return summary
+
+
+def aggregate_predictions(predictions, top_k=5, detailed=False):
+    matrix, names = pack_predictions(predictions)
+    return summarize(matrix, names, top_k=top_k, detailed=detailed)
+
+
+def prediction_time(prediction, offset=0.0):
+    # Face predictions carry "time" in seconds; prosody predictions carry {"begin", "end"}
+    time = prediction.get("time")
+    if isinstance(time, dict):
+        time = time.get("begin")
+    return None if time is None else float(time) + offset
+
+
+def emotion_timeline(predictions, windows=60, offsets=None):
+    # Downsamples the frame matrix into at most `windows` consecutive windows and
+    # returns the per-window mean emotion vectors quantized to uint8 (score * 255),
+    # row-major (windows x emotions) and base64-encoded to keep payloads small.
+    offsets = offsets if offsets is not None else [0.0] * len(predictions)
+    kept = [(p, offset) for p, offset in zip(predictions, offsets) if p and p.get("emotions")]
+    matrix, names = pack_predictions([p for p, _ in kept])
+    if matrix.shape[0] == 0:
+        return None
+
+    present = ~np.all(np.isnan(matrix), axis=0)
+    matrix = matrix[:, present]
+    names = [name for name, keep in zip(names, present) if keep]
+
+    n_frames = matrix.shape[0]
+    windows = max(1, min(windows, n_frames))
+    edges = np.linspace(0, n_frames, windows + 1).astype(int)
+
+    valid = ~np.isnan(matrix)
+    sums = np.add.reduceat(np.where(valid, matrix, 0.0), edges[:-1], axis=0)
+    counts = np.add.reduceat(valid, edges[:-1], axis=0)
+    means = sums / np.maximum(counts, 1)
+    quantized = np.round(np.clip(means, 0.0, 1.0) * 255).astype(np.uint8)
+
+    times = [prediction_time(p, offset) for p, offset in kept]
+    if all(t is not None for t in times):
+        starts = [round(times[i], 2) for i in edges[:-1]]
+        ends = [round(times[i - 1], 2) for i in edges[1:]]
+    else:
+        starts = [int(i) for i in edges[:-1]]
+        ends = [int(i) - 1 for i in edges[1:]]
+
+    return {
+        "emotions": names,
+        "windows": windows,
+        "start": starts,
+        "end": ends,
+        "encoding": "uint8-base64",
+        "scale": 255,
+        "data": base64.b64encode(quantized.tobytes()).decode('ascii'),
+    }
@@ -0,0 +1,69 @@
+# One long-lived asyncio loop per worker process, running in a daemon thread.
+# Sync Flask views submit coroutines here instead of calling asyncio.run(), so
+# loop setup is paid once and loop-bound clients/sockets can be reused.
+
+import asyncio
+import concurrent.futures
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+_loop = None
+_pid = None
+_lock = threading.Lock()
+
+
+def get_loop():
+    global _loop, _pid
+    # A forked gunicorn worker must not reuse the parent's loop thread
+    if _loop is not None and _pid == os.getpid() and _loop.is_running():
+        return _loop
+    with _lock:
+        if _loop is None or _pid != os.getpid() or not _loop.is_running():
+            loop = asyncio.new_event_loop()
+            started = threading.Event()
+
+            def run_forever():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(started.set)
+                loop.run_forever()
+
+            threading.Thread(target=run_forever, name="careerbuddy-event-loop", daemon=True).start()
+            started.wait()
+            _loop = loop
+            _pid = os.getpid()
+            logger.info("Started background event loop")
+    return _loop
+
+
+def submit(coro):
+    # Thread-safe; returns a concurrent.futures.Future
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+def run(coro, timeout=None):
+    # Block the calling thread until the coroutine finishes on the shared loop
+    future = submit(coro)
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise
+
+
+def iterate(agen, timeout=None):
+    # Drive an async generator on the shared loop from a sync generator (Flask
+    # streaming responses). Closing the sync generator closes the async one.
+    try:
+        while True:
+            try:
+                yield run(agen.__anext__(), timeout)
+            except StopAsyncIteration:
+                return
+    finally:
+        try:
+            run(agen.aclose(), timeout)
+        except Exception as e:
+            logger.debug(f"Error closing async generator: {str(e)}")
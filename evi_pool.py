@@ -0,0 +1,318 @@
+# Pool of pre-established Hume EVI websocket sessions, so audio synthesis skips the
+# TLS + websocket handshake. A background task per event loop keeps up to `size` idle
+# sessions open while the pool is in use (warmed, or checked out from within the
+# last max_idle seconds): it pings them, evicts ones idle or alive for too long, and
+# reconnects with jittered exponential backoff when connecting fails. Without
+# traffic nothing is refilled, so an idle worker holds no billed EVI sessions. A session is
+# reused after a request only if that request read the whole reply (assistant_end).
+# Whatever EVI sends to an idle session is read and dropped, and a warm session that
+# turns out dead when the request starts is replaced once by a fresh connection.
+
+import asyncio
+import contextlib
+import logging
+import random
+import time
+import weakref
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class _Session:
+    def __init__(self, websocket, opened_at):
+        self.websocket = websocket
+        self.opened_at = opened_at
+        self.idle_since = time.monotonic()
+        self.pinged_at = self.idle_since
+        self.reader = None
+
+
+class _LoopState:
+    # Sockets are bound to the loop that opened them, so each loop (the shared
+    # background loop, the ASGI server's loop) has its own idle sessions
+    def __init__(self):
+        self.idle = deque()
+        self.in_use = 0
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.failures = 0
+        # Warming counts as demand, so a freshly started pool fills once
+        self.demand_at = time.monotonic()
+
+
+class _Checkout:
+    """The websocket handed to a request.
+
+    A warm session can have died since its last ping (half-open TCP). If its first
+    send fails, or its first reply fails or doesn't arrive within first_reply_timeout,
+    the request moves to a fresh connection once and what it sent is replayed.
+    """
+
+    def __init__(self, pool, session, warm):
+        self.pool = pool
+        self.session = session
+        self.warm = warm
+        self.sent = []
+        self.replied = False
+        self.retried = False
+
+    @property
+    def open(self):
+        return self.session.websocket.open
+
+    def _can_retry(self):
+        return self.warm and not self.retried and not self.replied
+
+    async def _reconnect(self, error):
+        self.retried = True
+        self.pool.stale_retries += 1
+        logger.info(f"{self.pool.name}: warm session failed ({error!r}), retrying on a fresh one")
+        stale = self.session
+        self.session = await self.pool._open()
+        asyncio.ensure_future(self.pool._close(stale.websocket))
+        for message in self.sent:
+            await self.session.websocket.send(message)
+
+    async def send(self, message):
+        self.sent.append(message)
+        try:
+            await self.session.websocket.send(message)
+        except Exception as e:
+            if not self._can_retry():
+                raise
+            await self._reconnect(e)
+
+    async def recv(self):
+        if not self._can_retry():
+            return await self.session.websocket.recv()
+        try:
+            message = await asyncio.wait_for(self.session.websocket.recv(), self.pool.first_reply_timeout)
+        except Exception as e:
+            await self._reconnect(e)
+            message = await self.session.websocket.recv()
+        self.replied = True
+        return message
+
+    async def close(self):
+        await self.session.websocket.close()
+
+
+class EviPool:
+    def __init__(self, name, connect, size=2, max_idle=240.0, max_age=1500.0,
+                 ping_interval=20.0, ping_timeout=10.0, reconnect_base=0.5, reconnect_max=30.0,
+                 first_reply_timeout=10.0):
+        self.name = name
+        self.connect = connect  # async () -> websocket; raises on failure
+        self.size = size
+        self.max_idle = max_idle
+        self.max_age = max_age
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.reconnect_base = reconnect_base
+        self.reconnect_max = reconnect_max
+        self.first_reply_timeout = first_reply_timeout
+        self._states = weakref.WeakKeyDictionary()
+        self.warm_checkouts = 0
+        self.cold_checkouts = 0
+        self.stale_retries = 0
+        self.returned = 0
+        self.discarded = 0
+        self.evicted = 0
+        self.drained = 0
+        self.connects = 0
+        self.connect_failures = 0
+        self.ping_failures = 0
+
+    def _state(self, loop=None):
+        loop = loop or asyncio.get_running_loop()
+        state = self._states.get(loop)
+        if state is None:
+            state = self._states[loop] = _LoopState()
+        if self.size > 0 and (state.task is None or state.task.done()):
+            state.task = loop.create_task(self._maintain(state))
+        return state
+
+    def warm(self, loop):
+        # Thread-safe: starts filling the pool on `loop` without waiting for it
+        if self.size > 0 and loop not in self._states:
+            loop.call_soon_threadsafe(self._state, loop)
+
+    async def start(self):
+        self._state()
+
+    async def close(self):
+        # Stops maintenance on the running loop and closes its idle sessions
+        state = self._states.pop(asyncio.get_running_loop(), None)
+        if state is None:
+            return
+        if state.task is not None:
+            state.task.cancel()
+        while state.idle:
+            session = state.idle.pop()
+            await self._unpark(session)
+            await self._close(session.websocket)
+
+    def _usable(self, session, now):
+        return (session.websocket.open and now - session.idle_since < self.max_idle
+                and now - session.opened_at < self.max_age)
+
+    def _park(self, state, session, oldest=False):
+        # Idle sessions have a reader, so nothing EVI sends meanwhile is left queued
+        # for the next request, and a closed socket leaves the pool right away
+        session.idle_since = session.pinged_at = time.monotonic()
+        if oldest:
+            state.idle.appendleft(session)
+        else:
+            state.idle.append(session)
+        session.reader = asyncio.ensure_future(self._drain(state, session))
+
+    async def _unpark(self, session):
+        # recv() is cancel-safe; the reader must be gone before the request calls it
+        reader, session.reader = session.reader, None
+        if reader is not None and not reader.done():
+            reader.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await reader
+
+    async def _drain(self, state, session):
+        try:
+            while True:
+                message = await session.websocket.recv()
+                self.drained += 1
+                logger.debug(f"{self.name}: dropped message on an idle session: {str(message)[:200]}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.info(f"{self.name}: idle session closed: {str(e)}")
+            if session in state.idle:
+                state.idle.remove(session)
+                self.evicted += 1
+                state.wakeup.set()
+            await self._close(session.websocket)
+
+    async def _take(self, state):
+        while state.idle:
+            # Most recently returned first: the least likely to have been dropped upstream
+            session = state.idle.pop()
+            await self._unpark(session)
+            if self._usable(session, time.monotonic()):
+                return session
+            self.evicted += 1
+            asyncio.ensure_future(self._close(session.websocket))
+        return None
+
+    async def _open(self):
+        websocket = await self.connect()
+        self.connects += 1
+        return _Session(websocket, time.monotonic())
+
+    async def _close(self, websocket):
+        try:
+            await websocket.close()
+        except Exception as e:
+            logger.debug(f"{self.name}: error closing session: {str(e)}")
+
+    @contextlib.asynccontextmanager
+    async def session(self):
+        # Yields an open websocket, warm from the pool when one is idle. Connection
+        # errors propagate. The socket goes back to the pool only if the block exits
+        # normally and it is still open; an exception or cancellation closes it.
+        state = self._state()
+        state.demand_at = time.monotonic()
+        session = await self._take(state)
+        warm = session is not None
+        if warm:
+            self.warm_checkouts += 1
+        else:
+            self.cold_checkouts += 1
+            session = await self._open()
+        checkout = _Checkout(self, session, warm)
+        state.in_use += 1
+        completed = False
+        try:
+            yield checkout
+            completed = True
+        finally:
+            state.in_use -= 1
+            session = checkout.session
+            if (completed and len(state.idle) < self.size
+                    and time.monotonic() - session.opened_at < self.max_age and session.websocket.open):
+                self._park(state, session)
+                self.returned += 1
+            else:
+                self.discarded += 1
+                await self._close(session.websocket)
+            state.wakeup.set()
+
+    async def _ping(self, state, session):
+        try:
+            pong = await session.websocket.ping()
+            await asyncio.wait_for(pong, self.ping_timeout)
+            session.pinged_at = time.monotonic()
+        except Exception as e:
+            self.ping_failures += 1
+            logger.info(f"{self.name}: idle session failed its ping: {str(e)}")
+            # It may have been checked out meanwhile; the request then sees the failure
+            if session in state.idle:
+                state.idle.remove(session)
+                await self._unpark(session)
+                await self._close(session.websocket)
+
+    async def _maintain(self, state):
+        while True:
+            try:
+                now = time.monotonic()
+                for session in [s for s in state.idle if not self._usable(s, now)]:
+                    state.idle.remove(session)
+                    self.evicted += 1
+                    await self._unpark(session)
+                    await self._close(session.websocket)
+
+                due = [s for s in state.idle if now - s.pinged_at >= self.ping_interval]
+                if due:
+                    await asyncio.gather(*(self._ping(state, s) for s in due))
+
+                delay = self.ping_interval
+                # Checked-out sessions count: they come back once their request finishes
+                if len(state.idle) + state.in_use < self.size and now - state.demand_at < self.max_idle:
+                    try:
+                        self._park(state, await self._open(), oldest=True)
+                        state.failures = 0
+                        continue
+                    except Exception as e:
+                        state.failures += 1
+                        self.connect_failures += 1
+                        # Full jitter, like retry.RetryPolicy, so workers don't reconnect in lockstep
+                        delay = random.uniform(0, min(self.reconnect_max, self.reconnect_base * 2 ** state.failures))
+                        logger.warning(f"{self.name}: could not open a session ({str(e)}), "
+                                       f"retrying in {delay:.2f} seconds")
+
+                state.wakeup.clear()
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(state.wakeup.wait(), delay)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"{self.name}: pool maintenance failed: {str(e)}")
+                await asyncio.sleep(self.ping_interval)
+
+    def stats(self):
+        checkouts = self.warm_checkouts + self.cold_checkouts
+        return {
+            "name": self.name,
+            "size": self.size,
+            "idle": sum(len(state.idle) for state in list(self._states.values())),
+            "inUse": sum(state.in_use for state in list(self._states.values())),
+            "warmCheckouts": self.warm_checkouts,
+            "coldCheckouts": self.cold_checkouts,
+            "warmRate": round(self.warm_checkouts / checkouts, 4) if checkouts else 0.0,
+            "staleRetries": self.stale_retries,
+            "returned": self.returned,
+            "discarded": self.discarded,
+            "evicted": self.evicted,
+            "drained": self.drained,
+            "connects": self.connects,
+            "connectFailures": self.connect_failures,
+            "pingFailures": self.ping_failures,
+        }
@@ -0,0 +1,153 @@
+# Hedged requests: start the primary call, and if it hasn't finished within a
+# latency threshold derived from its own recent p95 (or if it fails first with an
+# error fallback_on accepts), start an alternate call and return whichever succeeds
+# first, cancelling the other. A primary that `unavailable` reports down (an open
+# circuit) is skipped and the alternate is called straight away.
+
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyTracker:
+    """Rolling window of recent successful call durations (seconds) per label."""
+
+    def __init__(self, window=200):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, label, seconds):
+        with self._lock:
+            self._samples.setdefault(label, deque(maxlen=self.window)).append(seconds)
+
+    def labels(self):
+        return list(self._samples)
+
+    def count(self, label):
+        return len(self._samples.get(label, ()))
+
+    def percentile(self, label, q):
+        with self._lock:
+            samples = list(self._samples.get(label, ()))
+        return float(np.percentile(samples, q)) if samples else None
+
+
+class Hedger:
+    def __init__(self, name, percentile=95, min_samples=20, default_delay=8.0,
+                 min_delay=1.0, max_delay=20.0, window=200, fallback_on=None, unavailable=None):
+        self.name = name
+        # Predicate on the primary's exception; errors it rejects (bad credentials,
+        # invalid requests) are raised as they are instead of starting the alternate
+        self.fallback_on = fallback_on or (lambda exc: True)
+        # Predicate on a label; True means the call would fail fast right now
+        self.unavailable = unavailable or (lambda label: False)
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.latency = LatencyTracker(window)
+        self.calls = 0
+        self.hedged = 0
+        self.fallbacks = 0
+        self.primary_wins = 0
+        self.hedge_wins = 0
+        self.failures = 0
+
+    def threshold(self, label):
+        # Until enough samples exist the configured default is used
+        if self.latency.count(label) < self.min_samples:
+            return self.default_delay
+        p = self.latency.percentile(label, self.percentile)
+        return min(self.max_delay, max(self.min_delay, p))
+
+    async def _timed(self, label, coro_factory):
+        start = time.monotonic()
+        result = await coro_factory()
+        self.latency.record(label, time.monotonic() - start)
+        return result
+
+    async def run(self, primary, alternate=None):
+        # primary / alternate: (label, coro_factory). Returns (result, label of the winner).
+        # Without an alternate this is a plain timed call of the primary.
+        self.calls += 1
+        primary_label, primary_factory = primary
+        if alternate is None:
+            return await self._timed(primary_label, primary_factory), primary_label
+
+        alternate_label, alternate_factory = alternate
+        if self.unavailable(primary_label):
+            self.fallbacks += 1
+            logger.warning(f"{self.name}: {primary_label} is unavailable, using {alternate_label}")
+            try:
+                result = await self._timed(alternate_label, alternate_factory)
+            except Exception:
+                self.failures += 1
+                raise
+            self.hedge_wins += 1
+            return result, alternate_label
+
+        primary_task = asyncio.ensure_future(self._timed(primary_label, primary_factory))
+        tasks = {primary_task: primary_label}
+        try:
+            done, _ = await asyncio.wait({primary_task}, timeout=self.threshold(primary_label))
+            if done and not primary_task.exception():
+                self.primary_wins += 1
+                return primary_task.result(), primary_label
+
+            if done and not self.fallback_on(primary_task.exception()):
+                self.failures += 1
+                raise primary_task.exception()
+            if done:
+                self.fallbacks += 1
+                logger.warning(f"{self.name}: {primary_label} failed, falling back to {alternate_label}")
+            else:
+                self.hedged += 1
+                logger.info(f"{self.name}: {primary_label} is slow, hedging with {alternate_label}")
+            tasks[asyncio.ensure_future(self._timed(alternate_label, alternate_factory))] = alternate_label
+
+            error = primary_task.exception() if done else None
+            pending = {task for task in tasks if not task.done()}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if tasks[task] == primary_label and task.exception() is not None \
+                            and not self.fallback_on(task.exception()):
+                        self.failures += 1
+                        raise task.exception()
+                    if task.exception() is None:
+                        if tasks[task] == primary_label:
+                            self.primary_wins += 1
+                        else:
+                            self.hedge_wins += 1
+                        return task.result(), tasks[task]
+                    error = error or task.exception()
+            self.failures += 1
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "hedged": self.hedged,
+            "fallbacks": self.fallbacks,
+            "primaryWins": self.primary_wins,
+            "hedgeWins": self.hedge_wins,
+            "hedgeWinRate": round(self.hedge_wins / (self.hedged + self.fallbacks), 4)
+            if self.hedged + self.fallbacks else 0.0,
+            "failures": self.failures,
+            "thresholds": {
+                label: round(self.threshold(label), 3) for label in self.latency.labels()
+            },
+        }
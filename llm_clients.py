@@ -0,0 +1,155 @@
+# Per-worker registry of OpenAI / Hugging Face clients so HTTP keep-alive pools
+# stay warm across requests instead of paying TLS + connection setup per call.
+# Keys hold a hash of the API key, never the key itself. Async clients are bound
+# to the event loop they were created on, so the loop is part of their key.
+#
+# The async Hugging Face client opens a new aiohttp session on every request, so
+# PooledAsyncInferenceClient sends its requests through one shared session per loop.
+
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import weakref
+from collections import OrderedDict
+
+from huggingface_hub import AsyncInferenceClient, InferenceClient, InferenceTimeoutError
+from openai import AsyncOpenAI, OpenAI
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+logger = logging.getLogger(__name__)
+
+
+def key_fingerprint(api_key):
+    return hashlib.sha256((api_key or "").encode('utf-8')).hexdigest()[:16]
+
+
+class ClientRegistry:
+    def __init__(self, name="llmClients", max_size=64):
+        self.name = name
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, provider, api_key, model=None, asynchronous=False):
+        loop_id = id(asyncio.get_running_loop()) if asynchronous else None
+        key = (provider, key_fingerprint(api_key), model, asynchronous, loop_id)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self._clients.move_to_end(key)
+                self.hits += 1
+                return client
+            self.misses += 1
+            client = create_client(provider, api_key, model, asynchronous)
+            self._clients[key] = client
+            while len(self._clients) > self.max_size:
+                # Not closed explicitly: an in-flight request may still hold it,
+                # its connection pool is released once it is garbage collected
+                self._clients.popitem(last=False)
+                self.evictions += 1
+            return client
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "name": self.name,
+            "backend": "memory",
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+            "size": len(self._clients),
+            "httpSessions": sum(1 for session in list(_sessions.values()) if not session.closed),
+        }
+
+
+# One aiohttp session (and so one keep-alive connection pool) per event loop
+_sessions = weakref.WeakKeyDictionary()
+
+
+def shared_session():
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        session = _sessions[loop] = aiohttp.ClientSession()
+    return session
+
+
+async def close_sessions():
+    # Closes the running loop's shared session (ASGI lifespan shutdown)
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
+
+
+class PooledAsyncInferenceClient(AsyncInferenceClient):
+    """AsyncInferenceClient whose non-streaming JSON requests reuse shared_session().
+
+    Errors are raised like AsyncInferenceClient.post does (aiohttp.ClientResponseError
+    with response_error_payload), so chat_completion's fallbacks still apply. A 503
+    while the model loads is raised instead of polled; the retry policy handles it.
+    """
+
+    async def post(self, *, json=None, data=None, model=None, task=None, stream=False):
+        if stream or data is not None or aiohttp is None:
+            return await super().post(json=json, data=data, model=model, task=task, stream=stream)
+
+        url = self._resolve_url(model, task)
+        try:
+            async with shared_session().post(
+                url, json=json, headers=self.headers, cookies=self.cookies,
+                timeout=aiohttp.ClientTimeout(self.timeout),
+            ) as response:
+                response_error_payload = None
+                if response.status != 200:
+                    try:
+                        response_error_payload = await response.json()
+                    except Exception:
+                        pass
+                try:
+                    response.raise_for_status()
+                except aiohttp.ClientResponseError as error:
+                    error.response_error_payload = response_error_payload
+                    raise
+                return await response.read()
+        except asyncio.TimeoutError as error:
+            raise InferenceTimeoutError(f"Inference call timed out: {url}") from error
+
+
+def create_client(provider, api_key, model, asynchronous):
+    if provider == 'openai':
+        # Async calls go through retry.with_retries, so the SDK's own retries are disabled
+        return AsyncOpenAI(api_key=api_key, max_retries=0) if asynchronous else OpenAI(api_key=api_key)
+    if provider == 'hf':
+        # The sync client already reuses huggingface_hub's per-thread requests session
+        client_class = PooledAsyncInferenceClient if asynchronous else InferenceClient
+        return client_class(model=model, token=api_key)
+    raise ValueError(f"Unknown LLM provider: {provider}")
+
+
+registry = ClientRegistry(max_size=int(os.getenv('LLM_CLIENT_REGISTRY_SIZE', 64)))
+
+
+def openai_client(api_key):
+    return registry.get('openai', api_key)
+
+
+def async_openai_client(api_key):
+    return registry.get('openai', api_key, asynchronous=True)
+
+
+def hf_client(token, model_name):
+    return registry.get('hf', token, model=model_name)
+
+
+def async_hf_client(token, model_name):
+    return registry.get('hf', token, model=model_name, asynchronous=True)
@@ -0,0 +1,186 @@
+# PDF text extraction for resumes and job descriptions.
+# Uses pypdfium2 (PDFium, C++) when available and PyPDF2 otherwise. Only the first
+# PDF_MAX_CHARS characters are ever needed for a prompt, so extraction stops as
+# soon as that much text is collected. Long documents are split into page ranges
+# extracted in a process pool, since both parsers hold the GIL.
+
+import concurrent.futures
+import contextlib
+import io
+import logging
+import multiprocessing
+import os
+import re
+import threading
+
+import PyPDF2
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
+
+logger = logging.getLogger(__name__)
+
+PDF_BACKEND = os.getenv('PDF_BACKEND', 'auto')  # auto | pdfium | pypdf2
+PDF_MAX_BYTES = int(os.getenv('PDF_MAX_BYTES', 10 * 1024 * 1024))
+PDF_MAX_PAGES = int(os.getenv('PDF_MAX_PAGES', 50))
+PDF_MAX_CHARS = int(os.getenv('PDF_MAX_CHARS', 32 * 1024))
+# Documents with at least this many pages are extracted in the process pool
+PDF_PARALLEL_MIN_PAGES = int(os.getenv('PDF_PARALLEL_MIN_PAGES', 16))
+PDF_WORKERS = int(os.getenv('PDF_WORKERS', min(4, os.cpu_count() or 1)))
+PDF_PAGES_PER_TASK = int(os.getenv('PDF_PAGES_PER_TASK', 8))
+# Separates pages in extracted text, so running headers and footers can be told
+# apart from lines that merely repeat (see prompt_compaction.clean_lines)
+PAGE_BREAK = '\f'
+# Bumped whenever extracted or normalized text changes, so cached text is re-extracted
+TEXT_VERSION = 2
+# PDFium writes U+0002 where a word was hyphenated across a line break
+PDFIUM_SOFT_HYPHEN = '\x02'
+
+
+class PdfLimitError(ValueError):
+    pass
+
+
+def resolve_backend(backend=None):
+    backend = backend or PDF_BACKEND
+    if backend == 'auto':
+        return 'pdfium' if pdfium is not None else 'pypdf2'
+    if backend == 'pdfium' and pdfium is None:
+        raise ValueError("PDF_BACKEND=pdfium but pypdfium2 is not installed")
+    if backend not in ('pdfium', 'pypdf2'):
+        raise ValueError(f"Unknown PDF backend: {backend}")
+    return backend
+
+
+def _open(data, backend):
+    if backend == 'pdfium':
+        return pdfium.PdfDocument(data)
+    return PyPDF2.PdfReader(io.BytesIO(data))
+
+
+def _page_count(document, backend):
+    return len(document) if backend == 'pdfium' else len(document.pages)
+
+
+def _page_text(document, backend, index):
+    if backend == 'pdfium':
+        page = document[index]
+        textpage = page.get_textpage()
+        try:
+            # PDFium uses CRLF line breaks; PyPDF2 and the prompts use LF
+            return textpage.get_text_bounded().replace('\r\n', '\n').replace(PDFIUM_SOFT_HYPHEN, '-')
+        finally:
+            textpage.close()
+            page.close()
+    return document.pages[index].extract_text() or ""
+
+
+def _extract_range(data, backend, start, stop, max_chars):
+    # Runs in a pool worker: opens its own copy of the document
+    document = _open(data, backend)
+    parts, size = [], 0
+    try:
+        for index in range(start, stop):
+            text = _page_text(document, backend, index)
+            parts.append(text)
+            size += len(text)
+            if size >= max_chars:
+                break
+    finally:
+        if backend == 'pdfium':
+            document.close()
+    return parts
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_pdfium_lock = threading.Lock()
+
+
+def _document_lock(backend):
+    return _pdfium_lock if backend == 'pdfium' else contextlib.nullcontext()
+
+
+def get_pool():
+    # One pool per worker process, recreated after a fork like event_loop.get_loop()
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+            _pool_pid = os.getpid()
+            logger.info(f"Started PDF extraction pool with {PDF_WORKERS} workers")
+        return _pool
+
+
+def _extract_parallel(data, backend, n_pages, max_chars):
+    # Page ranges are submitted one wave (PDF_WORKERS ranges) at a time and read in
+    # order, so a document whose first pages already fill max_chars costs one wave.
+    pool = get_pool()
+    ranges = [(start, min(start + PDF_PAGES_PER_TASK, n_pages))
+              for start in range(0, n_pages, PDF_PAGES_PER_TASK)]
+    parts, size = [], 0
+    for wave_start in range(0, len(ranges), PDF_WORKERS):
+        futures = [pool.submit(_extract_range, data, backend, start, stop, max_chars)
+                   for start, stop in ranges[wave_start:wave_start + PDF_WORKERS]]
+        for future in futures:
+            for text in future.result():
+                parts.append(text)
+                size += len(text)
+                if size >= max_chars:
+                    for pending in futures:
+                        pending.cancel()
+                    return parts
+    return parts
+
+
+def extract_text(data, max_pages=None, max_chars=None, backend=None, parallel=True):
+    # Returns at most max_chars characters from the first max_pages pages.
+    # Raises PdfLimitError for oversized files and the parser's error for broken ones.
+    # parallel=False keeps a long document in this process (used inside pool workers).
+    max_pages = max_pages or PDF_MAX_PAGES
+    max_chars = max_chars or PDF_MAX_CHARS
+    backend = resolve_backend(backend)
+    if len(data) > PDF_MAX_BYTES:
+        raise PdfLimitError(f"PDF is {len(data)} bytes, the limit is {PDF_MAX_BYTES}")
+
+    # PDFium is not thread-safe, so in-process use is serialized; pool workers are processes
+    with _document_lock(backend):
+        document = _open(data, backend)
+        try:
+            total_pages = _page_count(document, backend)
+            n_pages = min(total_pages, max_pages)
+            if total_pages > max_pages:
+                logger.info(f"PDF has {total_pages} pages, reading the first {max_pages}")
+            parallel = parallel and n_pages >= PDF_PARALLEL_MIN_PAGES and PDF_WORKERS > 1
+            if not parallel:
+                parts, size = [], 0
+                for index in range(n_pages):
+                    text = _page_text(document, backend, index)
+                    parts.append(text)
+                    size += len(text)
+                    if size >= max_chars:
+                        break
+        finally:
+            if backend == 'pdfium':
+                document.close()
+
+    if parallel:
+        parts = _extract_parallel(data, backend, n_pages, max_chars)
+    return PAGE_BREAK.join(parts)[:max_chars]
+
+
+def normalize(text):
+    # Tidies extracted text for prompts: unified line breaks, no trailing or repeated
+    # spaces, at most one blank line in a row, page breaks on a line of their own,
+    # no control characters. Line structure is otherwise kept.
+    text = text.replace('\r\n', '\n').replace('\r', '\n').replace(PDFIUM_SOFT_HYPHEN, '-')
+    text = re.sub(r'[\x00-\x08\x0e-\x1f\x7f]', '', text)
+    text = re.sub(r'[ \t\v]+', ' ', text)
+    text = re.sub(r'\s*\f\s*', '\n' + PAGE_BREAK + '\n', text)
+    text = re.sub(r' *\n *', '\n', text)
+    text = re.sub(r'\n{3,}', '\n\n', text)
+    return text.strip()
@@ -0,0 +1,63 @@
+import json
+import re
+
+OPEN_TAG = re.compile(r"\[PITCH(\d+)\]")
+
+# Longest prefix of an opening tag we may need to hold back between tokens, e.g. "[PITCH12"
+MAX_PARTIAL_TAG = len("[PITCH99]") - 1
+
+
+class PitchStreamParser:
+    """Incremental [PITCHn]...[/PITCHn] parser for streamed completions.
+
+    feed() returns the pitches completed by the newly received text, so each
+    pitch can be sent to the client as soon as its closing tag arrives.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.current = None
+        self.pitches = []
+
+    def feed(self, text):
+        self.buffer += text
+        completed = []
+        while True:
+            if self.current is None:
+                match = OPEN_TAG.search(self.buffer)
+                if not match:
+                    # Keep only what could still turn into an opening tag
+                    start = self.buffer.rfind("[")
+                    if start == -1 or len(self.buffer) - start > MAX_PARTIAL_TAG:
+                        self.buffer = ""
+                    else:
+                        self.buffer = self.buffer[start:]
+                    break
+                self.current = int(match.group(1))
+                self.buffer = self.buffer[match.end():]
+            else:
+                close_tag = f"[/PITCH{self.current}]"
+                end = self.buffer.find(close_tag)
+                if end == -1:
+                    break
+                completed.append(self._complete(self.buffer[:end]))
+                self.buffer = self.buffer[end + len(close_tag):]
+        return completed
+
+    def close(self):
+        # Flush a pitch whose closing tag never arrived (e.g. the model hit max_tokens)
+        completed = []
+        if self.current is not None and self.buffer.strip():
+            completed.append(self._complete(self.buffer))
+        self.buffer = ""
+        return completed
+
+    def _complete(self, content):
+        pitch = {"index": self.current, "pitch": content.strip()}
+        self.pitches.append(pitch["pitch"])
+        self.current = None
+        return pitch
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
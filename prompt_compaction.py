@@ -0,0 +1,191 @@
+# Prompt compaction for resumes and job descriptions before they are pasted into
+# the pitch prompt: whitespace is normalized, running page headers/footers, page
+# numbers and boilerplate lines are dropped, and text over the token budget is cut
+# section by section, boilerplate sections (EEO statements etc.) and the least
+# useful sections first.
+
+import logging
+import math
+import re
+from collections import Counter
+
+from pdf_text import PAGE_BREAK, normalize
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+PAGE_NUMBER = re.compile(r'^(page\s*)?\d{1,3}(\s*(of|/)\s*\d{1,3})?$', re.IGNORECASE)
+DECORATION = re.compile(r'^[\s\-_=*~•·.]*$')
+BOILERPLATE = re.compile(
+    r'equal (employment )?opportunity|without regard to (race|age|sex)|affirmative action|'
+    r'reasonable accommodation|e-verify|protected veteran|pay transparency|'
+    r'references available upon request',
+    re.IGNORECASE,
+)
+HEADING_MARKUP = re.compile(r'^[#*_\s]+|[#*_:\s]+$')
+# Whole headings only: "Data Privacy Engineering" is content, "Privacy Notice" is not
+BOILERPLATE_HEADING = re.compile(
+    r'(equal (employment )?opportunity( employer| statement| policy)?|eeo( statement| policy)?|'
+    r'(legal )?disclaimer|(applicant |candidate |data )?privacy( notice| policy| statement)?)'
+)
+# A line on the first or last PAGE_EDGE_LINES lines of two or more pages is a running
+# header/footer. Without page breaks (pasted text), only lines repeated at least
+# REPEATED_LINE_MIN times are treated that way.
+PAGE_EDGE_LINES = 2
+REPEATED_LINE_MIN = 4
+
+# Higher keeps longer. Unlisted headings get DEFAULT_PRIORITY, text before the first heading
+# (name, title, intro) gets LEAD_PRIORITY. Priority 0 sections are dropped first.
+SECTION_PRIORITIES = {
+    'resume': [
+        (('skill', 'experience', 'employment', 'work history', 'project'), 3),
+        (('summary', 'profile', 'objective', 'achievement', 'accomplishment', 'certification'), 2),
+        (('education', 'publication', 'award'), 1),
+        (('interest', 'hobbies', 'hobby', 'reference', 'personal'), 0),
+    ],
+    'job_description': [
+        (('requirement', 'qualification', 'skill', 'responsibilit', 'what you', 'duties', 'abilit',
+          'you will', 'experience'), 3),
+        (('job description', 'overview', 'role', 'position', 'summary'), 2),
+        (('about', 'company', 'who we are'), 1),
+        (('benefit', 'perk', 'we provide', 'we offer', 'compensation', 'why ', 'salary'), 0),
+    ],
+}
+DEFAULT_PRIORITY = 1
+LEAD_PRIORITY = 3
+
+
+def count_tokens(text):
+    # Exact with tiktoken (cl100k, the gpt-3.5 encoding) when installed, ~4 chars/token otherwise
+    if tiktoken is not None:
+        return len(_encoding().encode(text, disallowed_special=()))
+    return math.ceil(len(text) / 4)
+
+
+_encoding_instance = None
+
+
+def _encoding():
+    global _encoding_instance
+    if _encoding_instance is None:
+        _encoding_instance = tiktoken.get_encoding('cl100k_base')
+    return _encoding_instance
+
+
+def is_heading(line):
+    stripped = line.strip()
+    if not stripped or len(stripped) > 60 or stripped.startswith(('-', '•', '·')):
+        return False
+    if stripped.startswith('#'):
+        return True
+    if stripped.startswith('**') and stripped.endswith('**') and stripped.count('**') == 2:
+        return True
+    if stripped.endswith(':') and len(stripped.split()) <= 6:
+        return True
+    letters = [c for c in stripped if c.isalpha()]
+    if len(letters) >= 3 and all(c.isupper() for c in letters):
+        return True
+    # Short title-case lines such as "What You'll Do" or "Required Knowledge and Skills"
+    words = stripped.split()
+    capitalized = sum(1 for word in words if word[0].isupper())
+    return (len(words) <= 6 and stripped[-1] not in '.,;!' and stripped[0].isupper()
+            and capitalized * 2 >= len(words))
+
+
+def heading_priority(heading, kind):
+    title = HEADING_MARKUP.sub('', heading).lower()
+    for keywords, priority in SECTION_PRIORITIES.get(kind, []):
+        if any(keyword in title for keyword in keywords):
+            return priority
+    return DEFAULT_PRIORITY
+
+
+def running_lines(lines):
+    # Lowercased lines that look like page headers/footers
+    pages = [[]]
+    for line in lines:
+        if line == PAGE_BREAK:
+            pages.append([])
+        elif line.strip():
+            pages[-1].append(line.strip().lower())
+    if len(pages) == 1:
+        return {key for key, n in Counter(pages[0]).items() if n >= REPEATED_LINE_MIN}
+    edges = Counter()
+    for page in pages:
+        edges.update(set(page[:PAGE_EDGE_LINES] + page[-PAGE_EDGE_LINES:]))
+    return {key for key, n in edges.items() if n >= 2}
+
+
+def clean_lines(text):
+    # Normalized lines without page breaks, page numbers, separators, boilerplate
+    # lines and repeats of running headers/footers (their first occurrence is kept)
+    lines = []
+    raw_lines = normalize(text).split('\n')
+    running = running_lines(raw_lines)
+    seen = set()
+    for line in raw_lines:
+        if line == PAGE_BREAK:
+            continue
+        key = line.strip().lower()
+        if key and (PAGE_NUMBER.match(key) or DECORATION.match(key) or BOILERPLATE.search(key)):
+            continue
+        if key in running:
+            if key in seen:
+                continue
+            seen.add(key)
+        if not key and (not lines or not lines[-1]):
+            continue
+        lines.append(line)
+    return lines
+
+
+def split_sections(lines, kind, drop_boilerplate=True):
+    # [{"priority", "lines"}] in document order; a heading starts a new section
+    # A heading at the very top (the candidate's name, "Job description") stays in the lead
+    sections = [{"priority": LEAD_PRIORITY, "lines": []}]
+    for line in lines:
+        if is_heading(line) and (len(sections) > 1 or sections[0]["lines"]):
+            title = HEADING_MARKUP.sub('', line).lower()
+            boilerplate = drop_boilerplate and BOILERPLATE_HEADING.fullmatch(title)
+            priority = -1 if boilerplate else heading_priority(line, kind)
+            sections.append({"priority": priority, "lines": []})
+        sections[-1]["lines"].append(line)
+    return [s for s in sections if s["priority"] >= 0 and any(line.strip() for line in s["lines"])]
+
+
+def truncate_sections(sections, budget):
+    # Cuts the lowest-priority, longest section first: whole sections while that is not
+    # enough, then lines from its end. Token counts are summed per line (approximate).
+    costs = [[count_tokens(line) + 1 for line in s["lines"]] for s in sections]
+    total = sum(map(sum, costs))
+    order = sorted(range(len(sections)), key=lambda i: (sections[i]["priority"], -sum(costs[i])))
+    for i in order:
+        if total <= budget:
+            break
+        section_cost = sum(costs[i])
+        if total - section_cost >= budget:
+            total -= section_cost
+            sections[i]["lines"] = []
+            continue
+        while sections[i]["lines"] and total > budget:
+            sections[i]["lines"].pop()
+            total -= costs[i].pop()
+    return [s for s in sections if s["lines"]]
+
+
+def compact(text, budget, kind='resume'):
+    # Returns (compacted_text, tokens_before, tokens_after)
+    text = text or ""
+    before = count_tokens(text)
+    lines = clean_lines(text)
+    # Text that already fits keeps every section
+    over_budget = bool(budget) and count_tokens("\n".join(lines)) > budget
+    sections = split_sections(lines, kind, drop_boilerplate=over_budget)
+    if over_budget:
+        sections = truncate_sections(sections, budget)
+    compacted = "\n".join(line for s in sections for line in s["lines"]).strip()
+    return compacted, before, count_tokens(compacted)
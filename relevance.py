@@ -0,0 +1,113 @@
+# In-process TF-IDF index over resume sections. Built once per resume (see
+# resume_index) and queried per job description to keep only the resume
+# passages relevant to that job in the prompt. Queries are a sparse lookup plus one
+# small matrix-vector product, well under a millisecond for typical resumes.
+
+import re
+
+import numpy as np
+
+import cache
+from prompt_compaction import clean_lines, split_sections
+
+TOKEN = re.compile(r"[a-z0-9][a-z0-9+#.\-]*[a-z0-9+#]|[a-z0-9]")
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the this to was were will with
+you your we our us they their i my me he she his her not but if so such than then there these those
+who whom which what when where how all any each other into over under up out about after before
+""".split())
+
+
+def tokenize(text):
+    return [t for t in TOKEN.findall(text.lower()) if t not in STOPWORDS]
+
+
+def paragraphs(lines):
+    # Blank-line separated blocks; a lone title line (job or project name) is joined
+    # with the bullets that follow it
+    blocks, block = [], []
+    for line in lines + ['']:
+        if line.strip():
+            block.append(line)
+        elif block:
+            blocks.append(block)
+            block = []
+    merged = []
+    for block in blocks:
+        if merged and len(merged[-1]) == 1 and not merged[-1][0].lstrip().startswith(('-', '•')):
+            merged[-1] = merged[-1] + block
+        else:
+            merged.append(block)
+    return merged
+
+
+class ResumeIndex:
+    """Resume split into passages (paragraphs under their section heading) with a TF-IDF matrix."""
+
+    def __init__(self, text):
+        self.passages = []  # [{"heading", "lines", "lead"}], in document order
+        for number, section in enumerate(split_sections(clean_lines(text), 'resume')):
+            lines = section["lines"]
+            heading = lines[0] if number > 0 else None
+            for block in paragraphs(lines[1:] if heading else lines):
+                self.passages.append({"heading": heading, "lines": block, "lead": number == 0})
+
+        documents = [tokenize("\n".join(([p["heading"]] if p["heading"] else []) + p["lines"]))
+                     for p in self.passages]
+        self.vocabulary = {}
+        for tokens in documents:
+            for token in tokens:
+                self.vocabulary.setdefault(token, len(self.vocabulary))
+
+        counts = np.zeros((len(documents), len(self.vocabulary)), dtype=np.float32)
+        for row, tokens in enumerate(documents):
+            for token in tokens:
+                counts[row, self.vocabulary[token]] += 1
+        document_frequency = np.count_nonzero(counts, axis=0)
+        self.idf = np.log((1 + len(documents)) / (1 + document_frequency)).astype(np.float32) + 1
+        matrix = np.log1p(counts) * self.idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        self.matrix = matrix / np.maximum(norms, 1e-12)
+
+    def scores(self, query):
+        vector = np.zeros(len(self.vocabulary), dtype=np.float32)
+        for token in tokenize(query):
+            column = self.vocabulary.get(token)
+            if column is not None:
+                vector[column] += 1
+        vector = np.log1p(vector) * self.idf
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return np.zeros(len(self.passages), dtype=np.float32)
+        return self.matrix @ (vector / norm)
+
+    def select(self, query, top_k):
+        # The lead (name, title) plus the top_k passages most similar to the query,
+        # rendered in document order under their section headings
+        scores = self.scores(query)
+        candidates = [i for i, p in enumerate(self.passages) if not p["lead"] and p["lines"]]
+        ranked = sorted(candidates, key=lambda i: -scores[i])[:top_k]
+        keep = set(ranked) | {i for i, p in enumerate(self.passages) if p["lead"]}
+
+        lines, heading = [], None
+        for i, passage in enumerate(self.passages):
+            if i not in keep:
+                continue
+            if passage["heading"] and passage["heading"] != heading:
+                heading = passage["heading"]
+                lines += ['', heading]
+            lines += passage["lines"]
+        return "\n".join(lines).strip(), len(keep), len(self.passages)
+
+
+index_cache = cache.register(cache.MemoryCache('resumeIndexes', max_entries=256, ttl=3600))
+
+
+def resume_index(text):
+    # One index per distinct resume text, shared by every job description it is matched to
+    key = cache.hash_key(text)
+    index = index_cache.get(key)
+    if index is None:
+        index = ResumeIndex(text)
+        index_cache.set(key, index)
+    return index
@@ -0,0 +1,258 @@
+# Retry policy for upstream calls (OpenAI, Hugging Face, Hume):
+# errors are classified so only transient failures are retried, backoff is
+# jittered and capped by a per-request deadline budget, sleeping never blocks
+# the event loop, and a circuit breaker per provider fails fast while it is down.
+
+import asyncio
+import contextlib
+import contextvars
+import email.utils
+import logging
+import os
+import random
+import threading
+import time
+from functools import wraps
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+# Only these say the provider itself is unhealthy and count towards its circuit
+# breaker. Rate limits and quota are tied to the caller's key, and our own request
+# deadline running out says nothing about the provider.
+PROVIDER_FAILURES = {'timeout', 'server', 'connection'}
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class DeadlineExceededError(Exception):
+    pass
+
+
+class ErrorClass:
+    def __init__(self, kind, retryable, retry_after=None):
+        self.kind = kind
+        self.retryable = retryable
+        self.retry_after = retry_after
+        self.provider_failure = kind in PROVIDER_FAILURES
+
+
+def _status_and_headers(exc):
+    status = getattr(exc, 'status_code', None) or getattr(exc, 'status', None)
+    response = getattr(exc, 'response', None)
+    headers = getattr(exc, 'headers', None)
+    if response is not None:
+        status = status or getattr(response, 'status_code', None) or getattr(response, 'status', None)
+        headers = headers or getattr(response, 'headers', None)
+    return (status if isinstance(status, int) else None), headers
+
+
+def parse_retry_after(headers):
+    if not headers:
+        return None
+    try:
+        value = headers.get('retry-after-ms')
+        if value is not None:
+            return float(value) / 1000
+        value = headers.get('retry-after')
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            retry_at = email.utils.parsedate_to_datetime(value)
+            return max(0.0, retry_at.timestamp() - time.time())
+    except Exception:
+        return None
+
+
+def classify_error(exc):
+    if isinstance(exc, (CircuitOpenError, DeadlineExceededError)):
+        return ErrorClass('circuit_open' if isinstance(exc, CircuitOpenError) else 'deadline', False)
+
+    name = type(exc).__name__
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError)) or 'Timeout' in name:
+        return ErrorClass('timeout', True)
+
+    status, headers = _status_and_headers(exc)
+    if status is not None:
+        body = getattr(exc, 'body', None)
+        if status == 429 and isinstance(body, dict) and body.get('code') == 'insufficient_quota':
+            # Out of credits, retrying will not help
+            return ErrorClass('quota', False)
+        if status == 429:
+            return ErrorClass('rate_limit', True, parse_retry_after(headers))
+        if status in RETRYABLE_STATUS:
+            return ErrorClass('server' if status >= 500 else 'transient', True, parse_retry_after(headers))
+        if status in (401, 403):
+            return ErrorClass('auth', False)
+        return ErrorClass('client', False)
+
+    if isinstance(exc, (ConnectionError, OSError)) or 'Connection' in name:
+        return ErrorClass('connection', True)
+    # SDK wrappers (e.g. HumeClientException) keep the transport error as the cause
+    if exc.__cause__ is not None and exc.__cause__ is not exc:
+        return classify_error(exc.__cause__)
+    return ErrorClass('unknown', False)
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trips = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def before_call(self):
+        # Half-open lets calls through as probes; the first success closes the circuit
+        if self.state == 'open':
+            raise CircuitOpenError(f"{self.name} is unavailable, failing fast (circuit open)")
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    self.trips += 1
+                    logger.warning(f"Circuit for {self.name} opened after {self.failures} failures")
+                self.opened_at = time.monotonic()
+
+    def stats(self):
+        return {"name": self.name, "state": self.state, "failures": self.failures, "trips": self.trips}
+
+
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', 5))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv('CIRCUIT_RESET_TIMEOUT', 30))
+
+# EVI (audio synthesis) has its own breaker: an EVI outage or a bad config must not
+# fail the expression-measurement calls that go through 'hume'
+breakers = {
+    provider: CircuitBreaker(provider, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT)
+    for provider in ('openai', 'hf', 'hume', 'evi')
+}
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts=3, base_delay=0.5, max_delay=8.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt, error):
+        if error.retry_after is not None:
+            return min(error.retry_after, self.max_delay)
+        # Full jitter keeps retries from many workers from synchronising
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+DEFAULT_POLICY = RetryPolicy()
+
+# Absolute monotonic deadline for the current request, shared by all its upstream calls
+_deadline = contextvars.ContextVar('retry_deadline', default=None)
+
+
+@contextlib.contextmanager
+def deadline(seconds):
+    token = _deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_budget():
+    value = _deadline.get()
+    return None if value is None else value - time.monotonic()
+
+
+def _next_delay(provider, func_name, attempt, policy, exc):
+    # Returns the delay before the next attempt, or None if exc should propagate
+    error = classify_error(exc)
+    if error.provider_failure:
+        breakers[provider].record_failure()
+    if not error.retryable or attempt + 1 >= policy.max_attempts:
+        return None
+    wait = policy.delay(attempt, error)
+    budget = remaining_budget()
+    if budget is not None and wait >= budget:
+        logger.warning(f"{func_name}: not retrying {error.kind} error, request deadline reached")
+        return None
+    logger.warning(f"Attempt {attempt + 1} failed for {func_name} ({error.kind}): {str(exc)}. "
+                   f"Retrying in {wait:.2f} seconds...")
+    return wait
+
+
+def with_retries(provider, policy=None):
+    policy = policy or DEFAULT_POLICY
+
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                attempt = 0
+                while True:
+                    breakers[provider].before_call()
+                    budget = remaining_budget()
+                    if budget is not None and budget <= 0:
+                        raise DeadlineExceededError(f"Request deadline exceeded before calling {func.__name__}")
+                    try:
+                        if budget is None:
+                            result = await func(*args, **kwargs)
+                        else:
+                            try:
+                                result = await asyncio.wait_for(func(*args, **kwargs), budget)
+                            except asyncio.TimeoutError as e:
+                                if remaining_budget() > 0:
+                                    raise
+                                raise DeadlineExceededError(
+                                    f"Request deadline exceeded while calling {func.__name__}") from e
+                        breakers[provider].record_success()
+                        return result
+                    except Exception as e:
+                        wait = _next_delay(provider, func.__name__, attempt, policy, e)
+                        if wait is None:
+                            raise
+                        await asyncio.sleep(wait)
+                        attempt += 1
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            attempt = 0
+            while True:
+                breakers[provider].before_call()
+                try:
+                    result = func(*args, **kwargs)
+                    breakers[provider].record_success()
+                    return result
+                except Exception as e:
+                    wait = _next_delay(provider, func.__name__, attempt, policy, e)
+                    if wait is None:
+                        raise
+                    time.sleep(wait)
+                    attempt += 1
+        return wrapper
+    return decorator
+
+
+def stats():
+    return {provider: breaker.stats() for provider, breaker in breakers.items()}
@@ -0,0 +1,51 @@
+# Request coalescing: concurrent callers asking for the same key share one
+# in-flight coroutine and all receive its result (or its exception).
+# A future only works on the loop that created it, so calls are coalesced per event
+# loop: under asgi.py the worker's loop and event_loop.py's background loop each
+# have their own in-flight calls.
+
+import asyncio
+import logging
+import weakref
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.coalesced = 0
+        self._inflight = weakref.WeakKeyDictionary()  # loop -> {key: future}
+
+    async def do(self, key, coro_factory):
+        # Returns (result, shared); shared is True for callers that attached to another call
+        self.calls += 1
+        loop = asyncio.get_running_loop()
+        inflight = self._inflight.get(loop)
+        if inflight is None:
+            inflight = self._inflight[loop] = {}
+        future = inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            logger.info(f"{self.name}: joined in-flight call")
+            # shield so one caller disconnecting doesn't cancel the call for the others
+            return await asyncio.shield(future), True
+
+        future = asyncio.ensure_future(coro_factory())
+        inflight[key] = future
+
+        def forget(done):
+            if inflight.get(key) is done:
+                del inflight[key]
+
+        future.add_done_callback(forget)
+        return await asyncio.shield(future), False
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "inFlight": sum(len(inflight) for inflight in list(self._inflight.values())),
+        }
@@ -0,0 +1,27 @@
+# Upload buffering. Werkzeug spools each uploaded file into a SpooledTemporaryFile;
+# this only raises the in-memory threshold (hard-coded to 500KB upstream) to a
+# configurable spill limit, so typical practice recordings never touch disk.
+# Spilled files are anonymous temporary files, removed by the OS even on a crash.
+
+import base64
+import os
+import tempfile
+
+from flask import Request
+
+UPLOAD_SPILL_LIMIT = int(os.getenv('UPLOAD_SPILL_LIMIT', 16 * 1024 * 1024))
+
+
+class SpooledUploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPILL_LIMIT, mode="w+b")
+
+
+def read_upload(file_storage):
+    file_storage.stream.seek(0)
+    return file_storage.stream.read()
+
+
+def read_upload_base64(file_storage):
+    # Hume's stream API takes base64 payloads
+    return base64.b64encode(read_upload(file_storage))